@@ -0,0 +1,58 @@
+"""Vote db write throughput: persists then removes N votes, all queued at once like a burst of votes starting/ending.
+
+Run from the repo root: python -m bench.bench_db [--votes N] [--synchronous FULL]
+Only init/persist/remove are used, so it also runs against older checkouts of the db module to compare."""
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+from git_vote_cog.config import ChannelConfig
+from git_vote_cog.db import VoteDB
+from git_vote_cog.polls import PollId
+from git_vote_cog.votes import Vote
+
+
+def make_vote(i: int, config: ChannelConfig) -> Vote:
+    vote = Vote()
+    vote._issue_id = i
+    vote._poll_id = PollId(1, i)
+    vote.period_start = 0
+    vote.period_end = i
+    vote.config = config
+    return vote
+
+
+async def bench(votes: int, synchronous: Optional[str]):
+    config = ChannelConfig()
+    config.github.repo_name = "org/repo"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = VoteDB(Path(tmp)) if synchronous is None else VoteDB(Path(tmp), synchronous)
+        await db.init()
+
+        batch = [make_vote(i, config) for i in range(votes)]
+        start = time.perf_counter()
+        await asyncio.gather(*[db.persist(vote) for vote in batch])
+        await asyncio.gather(*[db.remove(vote) for vote in batch])
+        elapsed = time.perf_counter() - start
+
+        if hasattr(db, "close"):
+            await db.close()
+
+    print(f"votes={votes} synchronous={synchronous or 'default'} writes={2 * votes} elapsed={elapsed:.2f}s "
+          f"writes/sec={2 * votes / elapsed:.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--votes", type=int, default=2000)
+    parser.add_argument("--synchronous", choices=("OFF", "NORMAL", "FULL", "EXTRA"))
+    args = parser.parse_args()
+    asyncio.run(bench(args.votes, args.synchronous))
+
+
+if __name__ == "__main__":
+    main()
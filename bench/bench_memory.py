@@ -0,0 +1,129 @@
+"""Memory retained by N in-flight votes (Vote/Issue/Poll state), built from full REST pull payloads and full poll
+messages, the way lookups and poll fetches hand them over.
+
+Run from the repo root: python -m bench.bench_memory [--votes N]
+Only Vote/Issue/Poll constructors and setters are used, so it also runs against older checkouts to compare."""
+import argparse
+import gc
+import time
+import tracemalloc
+
+import discord
+
+from git_vote_cog.config import ChannelConfig
+from git_vote_cog.issues import Issue
+from git_vote_cog.polls import Poll
+from git_vote_cog.votes import Vote
+
+
+class FakeState:
+    """Just enough of discord's ConnectionState to build Message objects"""
+
+    def __init__(self):
+        self.users = {}
+
+    def store_user(self, data, **kwargs):
+        user = self.users.get(int(data["id"]))
+        if user is None:
+            user = self.users[int(data["id"])] = discord.User(state=self, data=data)
+        return user
+
+    def _get_guild(self, guild_id):
+        return None
+
+    def get_reaction_emoji(self, data):
+        return data["name"]
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def rest_pull(i: int) -> dict:
+    # shape/size of a REST pull request payload (repo objects trimmed)
+    user = {"login": f"author{i % 50}", "id": i % 50, "node_id": "MDQ6VXNlcjE=",
+            "avatar_url": "https://avatars.githubusercontent.com/u/1?v=4", "url": "https://api.github.com/users/x",
+            "html_url": "https://github.com/x", "type": "User", "site_admin": False}
+    repo = {"id": 1, "name": "votecog", "full_name": "org/votecog", "owner": user, "private": False,
+            "html_url": "https://github.com/org/votecog", "description": "A repo",
+            "url": "https://api.github.com/repos/org/votecog"}
+    return {
+        "url": f"https://api.github.com/repos/org/votecog/pulls/{i}", "id": 100000 + i,
+        "node_id": f"PR_kwDOAAAB{i}", "html_url": f"https://github.com/org/votecog/pull/{i}", "number": i,
+        "state": "open", "locked": False, "title": f"Improve thing number {i}", "user": user,
+        "body": "Some description of the change. " * 20,
+        "labels": [{"id": 1, "name": "vote_in_progress", "color": "ededed", "default": False}],
+        "created_at": "2024-01-01T00:00:00Z", "updated_at": "2024-01-01T00:00:00Z", "merged": False,
+        "merged_at": None,
+        "head": {"label": "x:branch", "ref": "branch", "sha": "a" * 40, "user": user, "repo": repo},
+        "base": {"label": "org:main", "ref": "main", "sha": "b" * 40, "user": user, "repo": repo},
+        "_links": {k: {"href": f"https://api.github.com/repos/org/votecog/{k}/{i}"}
+                   for k in ("self", "html", "issue", "comments", "commits", "statuses")},
+        "commits": 1, "additions": 10, "deletions": 2, "changed_files": 1,
+    }
+
+
+def poll_message(state: FakeState, channel, i: int, conf: ChannelConfig) -> discord.Message:
+    bot = {"id": "1", "username": "votebot", "discriminator": "0", "avatar": None, "bot": True}
+    media = conf.discord.media
+    data = {
+        "id": str(10 ** 17 + i), "channel_id": str(channel.id), "type": 0, "content": "", "author": bot,
+        "pinned": True, "mentions": [], "mention_roles": [], "attachments": [],
+        "timestamp": "2024-01-01T00:00:00+00:00",
+        "embeds": [{"title": f"PR #{i}", "description": "Vote to merge ..." + "x" * 200,
+                    "thumbnail": {"url": media.vote_start_icon},
+                    "footer": {"text": "Vote to accept/reject. Voting ends after 1 days"}}],
+        "reactions": [{"emoji": {"id": None, "name": media.aye_vote_emoji}, "count": 1 + i % 7, "me": True},
+                      {"emoji": {"id": None, "name": media.nay_vote_emoji}, "count": 1 + i % 5, "me": True}],
+    }
+    return discord.Message(state=state, channel=channel, data=data)
+
+
+def bench(votes: int):
+    state = FakeState()
+    # gateway channels are cached by discord.py either way
+    channel = discord.PartialMessageable(state=state, id=7, type=discord.ChannelType.text)
+    conf = ChannelConfig()
+    conf.discord.channel_id = 7
+    conf.github.repo_name = "org/votecog"
+    media = conf.discord.media
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    # what the github/discord lookups hand to the votes
+    pulls = [rest_pull(i) for i in range(votes)]
+    msgs = [poll_message(state, channel, i, conf) for i in range(votes)]
+
+    start = time.perf_counter()
+    running = []
+    for i in range(votes):
+        vote = Vote()
+        vote.issue = Issue(None, "org/votecog", pulls[i])
+        vote.poll = Poll(msgs[i], media.aye_vote_emoji, media.nay_vote_emoji)
+        vote.period_start = 0
+        vote.period_end = 86400
+        vote.config = conf
+        running.append(vote)
+    build = time.perf_counter() - start
+
+    # the payloads/messages are only referenced by the votes from here on
+    pulls.clear()
+    msgs.clear()
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    print(f"votes={votes} retained={retained / 2 ** 20:.1f}MiB per_vote={retained / votes:.0f}B "
+          f"build={build * 1000:.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--votes", type=int, default=10000)
+    args = parser.parse_args()
+    bench(args.votes)
+
+
+if __name__ == "__main__":
+    main()
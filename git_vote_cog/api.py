@@ -1,16 +1,19 @@
 import asyncio
 import datetime
 import time
+from pathlib import Path
+from typing import Dict, List, Optional, Callable
 
 import discord
-import github
-from discord import TextChannel, Message
-from redbot.core.bot import Red
+from discord import PartialMessage
 
 from git_vote_cog.config import *
+from git_vote_cog.github_api import GithubClient, ResponseCache, RateLimiter, PRIORITY_HIGH
 from git_vote_cog.issues import Issue
 from git_vote_cog.polls import Poll
-from git_vote_cog.util import wrap_async, pretty_print_timedelta, LOG
+from git_vote_cog.resolver import MessageResolver
+from git_vote_cog.tally import count_voters
+from git_vote_cog.util import pretty_print_timedelta, LOG, BLOCKING_POOL
 from git_vote_cog.votes import Vote
 
 
@@ -23,24 +26,54 @@ class Interrupted(Exception):
 
 
 class VoteAPI:
-    def __init__(self, config: GlobalConfig):
+    def __init__(self, config: GlobalConfig, resolver: MessageResolver, data_dir: Optional[Path] = None):
         self.config = config
-        self.client = github.Github(config.github.api_token)
+        self.resolver = resolver
+        self.cache_path: Optional[Path] = None
+        if data_dir is not None and config.github.cache_persist:
+            self.cache_path = data_dir / 'github_cache.json'
+
+        cache = ResponseCache(config.github.cache_size)
+        limiter = RateLimiter(config.github.rate_reserve, config.github.max_retries)
+        self.client = GithubClient(config.github.api_token, config.github.connections, cache, limiter)
         self.disposed = False
 
-    @wrap_async
-    def get_issue(self, repo_name: str, pr_id: int) -> Optional[Issue]:
-        issue: Optional[Issue]
-        try:
-            repo = self.client.get_repo(repo_name, lazy=True)
-            pr = repo.get_pull(pr_id)
-            issue = Issue(pr)
-        except github.UnknownObjectException:
-            issue = None
+    async def init(self):
+        if self.cache_path is not None:
+            await BLOCKING_POOL.run(self.client.cache.load, self.cache_path)
+
+    async def close(self):
+        await self.client.close()
+        if self.cache_path is not None:
+            await BLOCKING_POOL.run(self.client.cache.save, self.cache_path)
+
+    async def get_issue(self, repo_name: str, pr_id: int) -> Optional[Issue]:
+        issue: Optional[Issue] = None
+        pr = await self.client.get_pull(repo_name, pr_id)
+        if pr is not None:
+            issue = Issue(self.client, repo_name, pr)
 
         LOG.debug(f"Lookup {repo_name}/PR #{pr_id}: {issue}")
         return issue
 
+    async def load_issues(self, repo_name: str, pr_ids: List[int]) -> Dict[int, Optional[Issue]]:
+        """Bulk lookup of many PRs in a repo, batched into GraphQL queries. PRs of a batch that failed are left out,
+        to be looked up one by one."""
+        issues: Dict[int, Optional[Issue]] = {}
+        batch_size = self.config.github.graphql_batch_size
+        for i in range(0, len(pr_ids), batch_size):
+            batch = pr_ids[i:i + batch_size]
+            try:
+                pulls = await self.client.get_pulls(repo_name, batch)
+            except Exception:
+                LOG.exception(f"Bulk lookup of {len(batch)} PRs in {repo_name} failed, falling back to single lookups")
+                continue
+            for pr_id, pr in pulls.items():
+                issues[pr_id] = Issue(self.client, repo_name, pr) if pr is not None else None
+
+        LOG.debug(f"Bulk lookup of {len(pr_ids)} PRs in {repo_name}")
+        return issues
+
     def new_vote(self, issue: Issue, config: ChannelConfig) -> Vote:
         """Create a new vote object"""
 
@@ -49,75 +82,71 @@ class VoteAPI:
         vote.issue = issue
         vote.poll = None
         vote.period_start = int(time.time())
-        vote.period_end = vote.period_start + int(config.discord.voting_period_seconds)
+        vote.period_end = vote.period_start + config.discord.voting_period_seconds
         vote.config = config
 
         return vote
 
-    async def load_vote(self, vote: Vote, bot: Red) -> Optional[Vote]:
-        """Reload a vote object that was stored in the VoteDB"""
+    async def load_vote(self, vote: Vote, issues: Optional[Dict[int, Optional[Issue]]] = None) -> Optional[Vote]:
+        """Reload a vote object that was stored in the VoteDB. `issues` holds PRs already looked up in bulk."""
 
         # lookup issue data
-        issue: Issue = await self.get_issue(vote.config.github.repo_name, vote._issue_id)
+        issue: Optional[Issue]
+        if issues is not None and vote._issue_id in issues:
+            issue = issues[vote._issue_id]
+        else:
+            issue = await self.get_issue(vote.config.github.repo_name, vote._issue_id)
         if issue is None:
             return None
 
-        # lookup poll data
-        channel: TextChannel
-        try:
-            channel = await bot.fetch_channel(vote._poll_id.channel_id)
-        except discord.errors.NotFound:
+        # poll message handle, fetched only once its reactions are needed (a deleted poll shows up then)
+        msg = await self.resolver.partial(vote._poll_id.channel_id, vote._poll_id.msg_id)
+        if msg is None:
             return None
 
-        msg: Message
-        try:
-            msg = await channel.fetch_message(vote._poll_id.msg_id)
-        except discord.errors.NotFound:
-            return None
-
-        # build full msg object
+        # build poll object
         emojis = vote.config.discord.media
         vote.issue = issue
         vote.poll = Poll(msg, emojis.aye_vote_emoji, emojis.nay_vote_emoji)
         return vote
 
-    async def start_vote(self, bot: Red, vote: Vote):
+    async def start_vote(self, vote: Vote, on_poll: Optional[Callable[[Vote], None]] = None):
+        """Post the poll and mark the PR. `on_poll` is called as soon as the poll message exists, reactions can come in
+        from then on."""
         # config this vote will use
         emojis = vote.config.discord.media
         labels = vote.config.github.labels
 
-        channel = bot.get_channel(vote.config.discord.channel_id)
+        channel = await self.resolver.channel(vote.config.discord.channel_id)
         if channel is None:
             LOG.error(f"Error looking up channel_id found in channel conf. channel_id={vote.config.discord.channel_id}")
             raise NoChannel()
 
         # action to start polling
         async def create_poll():
+            await vote.issue.load_details()
             embed = _display_vote_start(vote)
 
-            # create msg with menu items
+            # create msg with menu items. The sent message has no reactions yet, the poll is left unseeded so its
+            # counts are read off the message once needed (refresh/end), taking in votes cast while it's set up
             poll_msg = await channel.send(embed=embed)
+            vote.poll = Poll(channel.get_partial_message(poll_msg.id), emojis.aye_vote_emoji,
+                             emojis.nay_vote_emoji)  # legacy, passing emojis here but should just keep that in config
+            if on_poll is not None:
+                on_poll(vote)
+
             await asyncio.gather(
                 poll_msg.add_reaction(emojis.aye_vote_emoji),
                 poll_msg.add_reaction(emojis.nay_vote_emoji),
                 _try_pin(poll_msg, "Voting has started")
             )
 
-            vote.poll = Poll(poll_msg, emojis.aye_vote_emoji,
-                             emojis.nay_vote_emoji)  # legacy, passing emojis here but should just keep that in config
-
-        # actions needed to start vote
+        # actions needed to start vote (label swap also removes previous vote results)
         actions = [
             create_poll(),
-            vote.issue.remove_label(labels.needs_vote),
-            vote.issue.add_label(labels.vote_in_progress)
+            vote.issue.transition_labels(labels, labels.vote_in_progress)
         ]
 
-        # remove previous vote results
-        for other_label in [labels.vote_rejected, labels.vote_accepted, labels.vote_in_progress]:
-            if other_label in vote.issue.labels:
-                actions.append(vote.issue.remove_label(other_label))
-
         # execute
         LOG.debug(f"Starting vote {vote}")
         try:
@@ -129,17 +158,39 @@ class VoteAPI:
 
         return vote
 
-    async def sleep_voting_period(self, vote: Vote):
-        remaining_seconds = vote.remaining_seconds()
-        if remaining_seconds > 0:
-            LOG.debug(f"Waiting {remaining_seconds} seconds before polling {vote}")
-            await asyncio.sleep(remaining_seconds)
+    async def render_poll(self, vote: Vote) -> discord.Embed:
+        """Poll embed of a running vote, with its live tally"""
+        await asyncio.gather(vote.issue.load_details(), self.seed_poll(vote.poll))
+        return _display_vote_start(vote)
+
+    async def seed_poll(self, poll: Poll):
+        """Read the counts of a poll that was resumed from a partial message"""
+        if not poll.seeded:
+            await poll.update(self.resolver, fresh=False)
 
-    async def end_vote(self, vote: Vote):
-        # get latest poll/issue data
+    async def end_vote(self, vote: Vote, label_result: bool = True, refresh_issue: bool = True):
+        """Close the vote: post the result and swap in the result label. `label_result` is False while another vote on
+        the same PR is still running, that one labels the PR once it ends. `refresh_issue` is False when the PR was
+        just looked up."""
+        if self.disposed:
+            raise Interrupted()
+
+        # get latest issue data (the tally is live, only re-read if asked to)
         LOG.debug(f"Ending vote {vote}")
+        discord_conf = vote.config.discord
+        by_voter = discord_conf.count_voters
+        fetch_poll = by_voter or discord_conf.verify_tally or (vote.poll is not None and not vote.poll.seeded)
         try:
-            await vote.update()
+            await vote.update(self.resolver if fetch_poll else None, refresh_issue)
+            if by_voter and vote.exists:
+                emojis = discord_conf.media
+                # the poll only keeps a partial message, the full one was just fetched (and cached) by the update
+                msg = await self.resolver.fetch(vote.poll.id.channel_id, vote.poll.id.msg_id)
+                if msg is not None:
+                    tally = await count_voters(msg, emojis.aye_vote_emoji, emojis.nay_vote_emoji,
+                                               discord_conf.duplicate_votes)
+                    LOG.debug(f"Vote {vote} counted by voter: {tally}")
+                    vote.poll.apply_tally(tally)
         except Exception as err:
             LOG.exception(f"Error updating vote data: {vote}")
             raise err
@@ -151,8 +202,8 @@ class VoteAPI:
             # vote cancelled - cleanup
             LOG.info(f"Vote {vote} has been cancelled. Cleaning up any labels/messages")
             actions = []
-            if vote.issue.exists and labels.vote_in_progress in vote.issue.labels:
-                actions.append(vote.issue.remove_label(labels.vote_in_progress))
+            if label_result and vote.issue.exists and labels.vote_in_progress in vote.issue.labels:
+                actions.append(vote.issue.set_labels(vote.issue.labels - {labels.vote_in_progress}, PRIORITY_HIGH))
             if vote.poll is not None and vote.poll.exists:
                 actions.append(_try_unpin(vote.poll.msg, "Vote cancelled"))
         else:
@@ -160,8 +211,8 @@ class VoteAPI:
             LOG.info(f"Vote {vote} is closing. Doing cleanup and adding result labels")
             result_label = labels.vote_accepted if vote.poll.is_vote_accepted() else labels.vote_rejected
             actions.append(vote.poll.msg.channel.send(embed=_display_vote_end(vote)))
-            actions.append(vote.issue.remove_label(labels.vote_in_progress))
-            actions.append(vote.issue.add_label(result_label))
+            if label_result:
+                actions.append(vote.issue.transition_labels(labels, result_label, PRIORITY_HIGH))
             actions.append(_try_unpin(vote.poll.msg, "Vote finished"))
 
         # execute
@@ -172,33 +223,16 @@ class VoteAPI:
                 LOG.exception(f"Error ending vote {vote}")
                 raise err
 
-    async def resume_vote(self, vote: Vote):
-        # wait for vote to finish
-        await self.sleep_voting_period(vote)
-        if self.disposed:
-            raise Interrupted()
-
-        # end the vote
-        await self.end_vote(vote)
-
-    async def run_vote(self, bot: Red, vote: Vote):
-        # start the vote
-        await self.start_vote(bot, vote)
-        if self.disposed:
-            raise Interrupted()
-
-        await self.resume_vote(vote)
-
 
 # try pin call
-async def _try_pin(msg: Message, reason: str):
+async def _try_pin(msg: PartialMessage, reason: str):
     try:
         await msg.pin(reason=reason)
     except discord.errors.Forbidden:
         pass
 
 
-async def _try_unpin(msg: Message, reason: str):
+async def _try_unpin(msg: PartialMessage, reason: str):
     try:
         await msg.unpin(reason=reason)
     except discord.errors.Forbidden:
@@ -212,14 +246,18 @@ def _display_vote_start(vote: Vote) -> discord.Embed:
     issue = vote.issue
 
     # format a poll message
-    issue_desc = issue.description if len(issue.description) < 200 else issue.description[:197] + '...'
-    vote_end = datetime.timedelta(seconds=int(config.discord.voting_period_seconds))
+    issue_desc = issue.description or ""
+    issue_desc = issue_desc if len(issue_desc) < 200 else issue_desc[:197] + '...'
+    vote_end = datetime.timedelta(seconds=config.discord.voting_period_seconds)
     vote_end = pretty_print_timedelta(vote_end)
+    aye_count = vote.poll.aye_count if vote.poll is not None else 0
+    nay_count = vote.poll.nay_count if vote.poll is not None else 0
 
     embed = discord.Embed()
     embed.set_thumbnail(url=emojis.vote_start_icon)
     embed.title = f"PR #{issue.id}"
-    embed.description = f"Vote to merge [**PR #{issue.id} - {issue.title}**]({issue.url}) by _{issue.author}_.\n```{issue_desc}```"
+    embed.description = f"Vote to merge [**PR #{issue.id} - {issue.title}**]({issue.url}) by _{issue.author}_.\n```{issue_desc}```\n" \
+                        f"`{emojis.aye_vote_emoji}x{aye_count} to {emojis.nay_vote_emoji}x{nay_count}`, ends <t:{vote.period_end}:R>"
     embed.set_footer(
         text=f"Vote {emojis.aye_vote_emoji} to accept, {emojis.nay_vote_emoji} to reject. Voting ends after {vote_end}")
 
@@ -238,5 +276,7 @@ def _display_vote_end(vote: Vote) -> discord.Embed:
         url=media.vote_accepted_icon if accepted else media.vote_rejected_icon)
     embed.title = "Vote Accepted" if accepted else f"Vote Rejected"
     embed.description = f"[PR #{vote.issue.id} - {vote.issue.title}]({vote.issue.url}) has been **{result}**.\n\n`{vote.poll.aye_emoji}x{vote.poll.aye_count} to {vote.poll.nay_emoji}x{vote.poll.nay_count}`"
+    if not vote.poll.tally_complete:
+        embed.description += "\n_Counting stopped once the outcome was settled._"
 
     return embed
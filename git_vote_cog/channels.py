@@ -0,0 +1,116 @@
+import fnmatch
+import re
+from typing import Optional, Dict, List, Tuple, Pattern
+
+from git_vote_cog.config import ChannelConfig
+
+# repo -> channels matches remembered by `ChannelConfigCache.for_repo`
+MATCH_CACHE_SIZE = 1024
+
+
+def is_repo_pattern(repo_name: str) -> bool:
+    """repo_name is a glob (like 'org/*') matching many repos"""
+    return any(c in repo_name for c in "*?[")
+
+
+def repo_matches(pattern: str, repo_name: str) -> bool:
+    return fnmatch.fnmatchcase(repo_name.lower(), pattern.lower())
+
+
+class ChannelConfigCache:
+    """In memory copy of every channel's config, keyed by channel id and by repo. Filled once on init and written
+    through whenever a channel config is set, so lookups never go to config storage. Configs handed out are frozen
+    snapshots shared by everything using them (running votes included), changes replace them via `put`.
+
+    Several channels can follow the same repo, and a channel's repo_name can be a glob pattern ('org/*'). Repo names
+    are matched case-insensitively, the channels matching a repo are memoized until the next change."""
+
+    def __init__(self):
+        self.channels: Dict[int, ChannelConfig] = {}
+        self.repos: Dict[str, List[ChannelConfig]] = {}
+        self.patterns: List[Tuple[Pattern, ChannelConfig]] = []
+        self._matches: Dict[str, List[ChannelConfig]] = {}
+        self._resolved: Dict[Tuple[int, str], ChannelConfig] = {}
+
+    def __len__(self) -> int:
+        return len(self.channels)
+
+    def get(self, channel_id: int) -> Optional[ChannelConfig]:
+        return self.channels.get(channel_id)
+
+    def for_repo(self, repo_name: str) -> List[ChannelConfig]:
+        """Configs of every channel following `repo_name`, directly or by pattern"""
+        key = repo_name.lower()
+        matches = self._matches.get(key)
+        if matches is None:
+            matches = list(self.repos.get(key, []))
+            matches.extend(conf for pattern, conf in self.patterns if pattern.match(key))
+            if len(self._matches) >= MATCH_CACHE_SIZE:
+                self._matches.clear()
+            self._matches[key] = matches
+
+        return matches
+
+    def resolve(self, conf: ChannelConfig, repo_name: str) -> ChannelConfig:
+        """Config for a vote on `repo_name` in conf's channel. For a pattern channel that's a (shared) copy naming
+        the actual repo, since votes are stored and resumed by their config's repo_name."""
+        if conf.github.repo_name == repo_name:
+            return conf
+
+        key = (conf.discord.channel_id, repo_name)
+        resolved = self._resolved.get(key)
+        if resolved is None:
+            resolved = conf.copy()
+            resolved.github.repo_name = repo_name
+            resolved = self._resolved[key] = resolved.freeze()
+        return resolved
+
+    def put(self, channel_id: int, conf: ChannelConfig) -> ChannelConfig:
+        conf.freeze()
+        self.remove(channel_id)
+        self.channels[channel_id] = conf
+
+        repo_name = conf.github.repo_name
+        if repo_name is not None and len(repo_name) > 0:
+            if is_repo_pattern(repo_name):
+                self.patterns.append((re.compile(fnmatch.translate(repo_name.lower())), conf))
+            else:
+                self.repos.setdefault(repo_name.lower(), []).append(conf)
+        self._changed()
+        return conf
+
+    def remove(self, channel_id: int):
+        old = self.channels.pop(channel_id, None)
+        if old is None:
+            return
+
+        repo_name = old.github.repo_name
+        if repo_name is not None and len(repo_name) > 0:
+            if is_repo_pattern(repo_name):
+                self.patterns = [(pattern, conf) for pattern, conf in self.patterns if conf is not old]
+            else:
+                confs = [conf for conf in self.repos.get(repo_name.lower(), []) if conf is not old]
+                if len(confs) > 0:
+                    self.repos[repo_name.lower()] = confs
+                else:
+                    self.repos.pop(repo_name.lower(), None)
+        self._changed()
+
+    def load(self, all_channels: Dict[int, dict]):
+        """Fill from Red's Config.all_channels()"""
+        self.clear()
+        for channel_id, raw_conf in all_channels.items():
+            conf = ChannelConfig().from_dict(raw_conf)
+            if conf.discord.channel_id is None:
+                conf.discord.channel_id = channel_id
+            self.put(channel_id, conf)
+
+    def clear(self):
+        self.channels.clear()
+        self.repos.clear()
+        self.patterns.clear()
+        self._changed()
+
+    def _changed(self):
+        self._matches.clear()
+        self._resolved.clear()
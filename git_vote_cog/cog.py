@@ -1,5 +1,8 @@
 import asyncio
-from typing import Union, Dict
+import datetime
+import time
+from functools import partial
+from typing import Union, Dict, List, Type
 
 import discord
 import redbot.core
@@ -11,14 +14,27 @@ from redbot.core.commands import Context
 from redbot.core.data_manager import cog_data_path
 
 from .api import VoteAPI, Interrupted
+from .channels import ChannelConfigCache, is_repo_pattern, repo_matches
 from .config import *
 from .db import VoteDB
+from .export import export_history_async, EXPORT_FORMATS, EXPORT_POOL
 from .issues import Issue
-from .util import LOG
+from .refresher import PollRefresher
+from .resolver import MessageResolver
+from .resume import ResumeProgress
+from .scheduler import DeadlineScheduler
+from .util import LOG, pretty_print_timedelta, BLOCKING_POOL
 from .votes import Vote
 from .webhook import Webhook, LabelEvent
 
 
+# max votes shown by `!vote list`, keeps the embed field under discord's size limit
+LIST_VOTES_LIMIT = 8
+
+# how often `!vote export` reports progress
+EXPORT_PROGRESS_SECONDS = 2.0
+
+
 class VoteCog(commands.Cog):
     def __init__(self, bot: Red, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -36,8 +52,24 @@ class VoteCog(commands.Cog):
         self.webhook: Optional[Webhook] = None
         self.vote_db: Optional[VoteDB] = None
 
-        # reverse repo_name->channel lookup. used for webhook events
-        self.repo_lookup: Dict[str, ChannelConfig] = {}
+        # cache first discord channel/message lookups
+        self.resolver: MessageResolver = MessageResolver(bot)
+
+        # vote deadlines, keyed by (channel_id, message_id) of the poll
+        self.scheduler: DeadlineScheduler = DeadlineScheduler()
+
+        # running votes, keyed by poll message id. their tallies are kept live from reaction events
+        self.polls: Dict[int, Vote] = {}
+        self.refresher: Optional[PollRefresher] = None
+
+        # startup resume of persisted votes
+        self.resume_task: Optional[asyncio.Task] = None
+        self.resume_limit: asyncio.Semaphore = asyncio.Semaphore(8)
+        self.resume_progress: Optional[ResumeProgress] = None
+
+        # config snapshots, written through on set. channel configs are also looked up by repo for webhook events
+        self.global_conf: GlobalConfig = GlobalConfig().freeze()
+        self.channel_configs: ChannelConfigCache = ChannelConfigCache()
 
     def cog_unload(self):
         LOG.info("cog_unload")
@@ -46,21 +78,37 @@ class VoteCog(commands.Cog):
     async def clean_up(self):
         LOG.info("clean_up")
 
-        # dispose vote machine
-        if self.vote_machine is not None:
-            self.vote_machine.disposed = True
-            self.vote_machine = None
-
-        # dispose webhook
+        # stop taking webhook events, events already queued still start their votes
         if self.webhook is not None and self.webhook.running:
             await self.webhook.stop()
             self.webhook = None
 
-        # clear repo_lookup
-        self.repo_lookup.clear()
+        # no new vote ends from here on, ends under way are waited for by the scheduler
+        if self.vote_machine is not None:
+            self.vote_machine.disposed = True
+
+        # drop pending vote deadlines (votes stay persisted, they are picked up again on init)
+        if self.resume_task is not None:
+            self.resume_task.cancel()
+            self.resume_task = None
+        await self.scheduler.stop()
+        self.polls.clear()
+        self.resolver.clear()
+        if self.refresher is not None:
+            await self.refresher.stop()
+            self.refresher = None
+
+        # dispose vote machine, nothing is left using it
+        if self.vote_machine is not None:
+            await self.vote_machine.close()
+            self.vote_machine = None
+
+        # clear config cache
+        self.channel_configs.clear()
 
         # close vote db
         if self.vote_db is not None:
+            await self.vote_db.close()
             self.vote_db = None
 
     async def init(self):
@@ -68,33 +116,38 @@ class VoteCog(commands.Cog):
         LOG.info("init")
         await self.clean_up()
 
-        # load repo_lookup
-        for conf in (await self.config.all_channels()).values():
-            conf = ChannelConfig().from_dict(conf)
-            if conf.github.repo_name is not None and len(conf.github.repo_name) > 0:
-                self.repo_lookup[conf.github.repo_name] = conf
-
-        # load conf
-        conf = await self._global_config()
+        # load config cache, the only config storage reads until the next init
+        self.channel_configs.load(await self.config.all_channels())
+        conf = GlobalConfig().from_dict(await self.config.all(acquire_lock=False)).freeze()
+        self.global_conf = conf
 
         # new vote machine
         if conf.github.api_token is not None and len(conf.github.api_token) > 0:
-            self.vote_machine = VoteAPI(conf)
+            self.vote_machine = VoteAPI(conf, self.resolver, cog_data_path(self))
+            await self.vote_machine.init()
+            self.refresher = PollRefresher(self.vote_machine.render_poll)
+
+        # vote db
+        self.vote_db = VoteDB(cog_data_path(self), conf.db.synchronous)
+        await self.vote_db.init()
 
         # new webhook
-        if bool(conf.github.webhook.on) and conf.github.webhook.on != 'False':
-            self.webhook = Webhook(conf.github.webhook, self.on_pr_labeled)
+        if conf.github.webhook.on:
+            store = self.vote_db if conf.github.webhook.dedup_persist else None
+            self.webhook = Webhook(conf.github.webhook, self.on_pr_labeled, store)
             self.webhook.config = conf.github.webhook
             await self.webhook.start()
 
-        # vote db
-        self.vote_db = VoteDB(cog_data_path(self))
-        await self.vote_db.init()
+        # vote deadlines
+        self.scheduler.start()
 
-        # resume running votes
-        for vote in await self.vote_db.list():
-            LOG.info(f"Resuming vote on PR #{vote._issue_id} in {vote.config.github.repo_name}")
-            asyncio.create_task(self._resume_vote(vote))
+        # resume persisted votes in the background
+        if self.vote_machine is not None:
+            self.resume_progress = ResumeProgress()
+            self.resume_limit = asyncio.Semaphore(conf.resume.concurrency)
+            self.resume_task = asyncio.create_task(self._resume_votes(conf.resume))
+        else:
+            LOG.warning("No VoteAPI instance exists (is the api_token set?), persisted votes are not resumed")
 
     @commands.group()
     async def vote(self, ctx: Context):
@@ -110,8 +163,8 @@ class VoteCog(commands.Cog):
             await ctx.message.add_reaction("☑")
 
     @vote.command(name="start")
-    async def start_vote(self, ctx: Context, pull_request_id: int):
-        """Initiate a vote on a pull request"""
+    async def start_vote(self, ctx: Context, pull_request_id: int, repo_name: Optional[str] = None):
+        """Initiate a vote on a pull request. Pass the repo if the channel follows a repo pattern (like 'org/*')."""
 
         # load config
         conf = await self._channel_config(ctx.channel)
@@ -132,11 +185,20 @@ class VoteCog(commands.Cog):
             )
             return
 
+        # check the repo is one this channel follows
+        repo_name = repo_name or conf.github.repo_name
+        if is_repo_pattern(repo_name) or not repo_matches(conf.github.repo_name, repo_name):
+            await asyncio.gather(
+                ctx.send(f"`Pass a repo matching '{conf.github.repo_name}'`"),
+                ctx.message.add_reaction("❌")
+            )
+            return
+
         # lookup the issue
-        issue: Issue = await self.vote_machine.get_issue(conf.github.repo_name, pull_request_id)
+        issue: Issue = await self.vote_machine.get_issue(repo_name, pull_request_id)
         if issue is None:
             await asyncio.gather(
-                ctx.send(f"`PR #{pull_request_id} not found in {conf.github.repo_name}`"),
+                ctx.send(f"`PR #{pull_request_id} not found in {repo_name}`"),
                 ctx.message.add_reaction("❌")
             )
             return
@@ -148,15 +210,18 @@ class VoteCog(commands.Cog):
         LOG.debug(
             f"PR #{event.pr_id} in {event.repo_name} {'added' if event.label_added else 'removed'} label {event.label_name}")
 
-        # start by looking up the channel config
-        conf = self.repo_lookup[event.repo_name]
-        if conf is None:
+        # start by looking up the configs of the channels following the repo
+        confs = self.channel_configs.for_repo(event.repo_name)
+        if len(confs) == 0:
             LOG.warn(
                 f"Encountered label added webhook event for repo '{event.repo_name}', but no channel connected to that name exists!")
             return
 
         # check if this a vote start label
-        if not event.label_added or event.label_name != conf.github.labels.needs_vote:
+        if not event.label_added:
+            return
+        confs = [conf for conf in confs if event.label_name == conf.github.labels.needs_vote]
+        if len(confs) == 0:
             return
 
         # Check if api token is setup
@@ -165,66 +230,399 @@ class VoteCog(commands.Cog):
                 f"Encountered needs_vote label in webhook event for repo '{event.repo_name}' PR #{event.pr_id}, but no VoteAPI instance exists (is the api_token set?)")
             return
 
-        # lookup the issue
-        issue: Issue = await self.vote_machine.get_issue(conf.github.repo_name, event.pr_id)
+        # lookup the issue, once for all channels
+        issue: Issue = await self.vote_machine.get_issue(event.repo_name, event.pr_id)
         if issue is None:
             LOG.error(
                 f"Encountered needs_vote label in webhook event for repo '{event.repo_name} PR #{event.pr_id}, but failed to lookup the issue!")
             return
 
-        # execute vote
-        await self._run_vote(issue, conf)
+        # execute a vote in every channel, a few at a time
+        limit = asyncio.Semaphore(self.global_conf.github.webhook.fanout)
+
+        async def run(conf: ChannelConfig):
+            async with limit:
+                try:
+                    await self._run_vote(issue, conf)
+                except Exception:
+                    LOG.exception(f"Error starting vote on PR #{event.pr_id} in channel {conf.discord.channel_id}")
+
+        await asyncio.gather(*[run(conf) for conf in confs])
 
     async def _run_vote(self, issue: Issue, conf: ChannelConfig):
-        # new vote data
-        vote = self.vote_machine.new_vote(issue, conf)
+        # new vote data, its config names the actual repo (the channel's may be a pattern)
+        vote = self.vote_machine.new_vote(issue, self.channel_configs.resolve(conf, issue.repo_name))
 
-        # execute vote
+        # start vote, its reactions are tracked from the moment the poll is posted
         try:
-            await self.vote_machine.start_vote(self.bot, vote)
+            await self.vote_machine.start_vote(vote, on_poll=self._track_poll)
             await self.vote_db.persist(vote)
-            await self.vote_machine.resume_vote(vote)
-        except Interrupted:
-            return
-
-        # delete old vote data
-        await self.vote_db.remove(vote)
-
-    async def _resume_vote(self, vote_data: Vote):
+        except Exception:
+            if vote.poll is not None:
+                self._untrack_poll(vote)
+            raise
+
+        # end it once the voting period is over
+        self._schedule_end(vote)
+
+    async def _resume_votes(self, conf: ResumeConfig):
+        """Resume persisted votes, soonest deadline first. Expired votes are ended right away, in bounded parallel
+        batches. The rest are only looked up (github/discord) shortly before their deadline, votes due within one
+        hydrate window together."""
+        progress = self.resume_progress
+        batch_size = conf.batch_size
+        hydrate_lead_seconds = conf.hydrate_lead_seconds
+
+        expired: List[Vote] = []
+        hydrate: List[Vote] = []
+        async for vote in self.vote_db.iterate(page_size=batch_size):
+            progress.loaded += 1
+            if vote.remaining_seconds() <= 0:
+                expired.append(vote)
+                if len(expired) >= batch_size:
+                    await self._end_expired_votes(expired)
+                    expired = []
+                continue
+
+            # votes come in deadline order, a batch is hydrated ahead of its first deadline
+            if len(hydrate) > 0 and (len(hydrate) >= batch_size
+                                     or vote.period_end > hydrate[0].period_end + hydrate_lead_seconds):
+                self._schedule_hydrate(hydrate, hydrate_lead_seconds)
+                hydrate = []
+            hydrate.append(vote)
+            progress.scheduled += 1
+
+        if len(expired) > 0:
+            await self._end_expired_votes(expired)
+        if len(hydrate) > 0:
+            self._schedule_hydrate(hydrate, hydrate_lead_seconds)
+
+        progress.ready_at = time.time()
+        LOG.info(f"Resumed votes: {progress}")
+
+    async def _load_issues(self, votes: List[Vote]) -> Dict[str, Dict[int, Optional[Issue]]]:
+        # look up the votes' PRs in bulk, per repo
+        issues: Dict[str, Dict[int, Optional[Issue]]] = {}
+        votes_by_repo: Dict[str, List[Vote]] = {}
+        for vote in votes:
+            votes_by_repo.setdefault(vote.config.github.repo_name, []).append(vote)
+        for repo_name, repo_votes in votes_by_repo.items():
+            issues[repo_name] = await self.vote_machine.load_issues(repo_name, [vote._issue_id for vote in repo_votes])
+        return issues
+
+    async def _end_expired_votes(self, votes: List[Vote]):
+        progress = self.resume_progress
+        progress.expired += len(votes)
+        issues = await self._load_issues(votes)
+
+        # the ends run as scheduler callbacks due now, so an unload lets the ones under way finish
+        loop = asyncio.get_running_loop()
+        now = time.time()
+        ended = []
+        for vote in votes:
+            done = loop.create_future()
+            key = (vote._poll_id.channel_id, vote._poll_id.msg_id)
+            repo_issues = issues.get(vote.config.github.repo_name, {})
+            self.scheduler.schedule(key, now, partial(self._end_expired_vote, vote, repo_issues, done))
+            ended.append(done)
+        await asyncio.wait(ended)
+
+    async def _end_expired_vote(self, vote_data: Vote, issues: Dict[int, Optional[Issue]], done: asyncio.Future):
+        progress = self.resume_progress
+        try:
+            async with self.resume_limit:
+                vote = await self._resume_vote(vote_data, issues)
+                if vote is not None:
+                    # a PR from the bulk lookup is fresh, only one that fell back to a single lookup is re-read
+                    await self._end_vote(vote, refresh_issue=vote_data._issue_id not in issues)
+                    progress.ended += 1
+        except Exception:
+            LOG.exception(f"Error ending expired vote on PR #{vote_data._issue_id}")
+            progress.failed += 1
+        finally:
+            done.set_result(None)
+
+    def _schedule_hydrate(self, votes: List[Vote], hydrate_lead_seconds: int):
+        first = votes[0]
+        key = ("hydrate", first._poll_id.channel_id, first._poll_id.msg_id)
+        self.scheduler.schedule(key, first.period_end - hydrate_lead_seconds, partial(self._hydrate_votes, votes))
+
+    async def _hydrate_votes(self, votes: List[Vote]):
+        try:
+            issues = await self._load_issues(votes)
+        except Exception:
+            LOG.exception(f"Error looking up {len(votes)} PRs to resume")
+            issues = {}
+
+        async def hydrate(vote_data: Vote):
+            async with self.resume_limit:
+                try:
+                    vote = await self._resume_vote(vote_data, issues.get(vote_data.config.github.repo_name))
+                except Exception:
+                    LOG.exception(f"Error resuming vote on PR #{vote_data._issue_id}")
+                    self.resume_progress.failed += 1
+                    return
+
+            if vote is not None:
+                self.resume_progress.hydrated += 1
+                self._schedule_end(vote)
+
+        await asyncio.gather(*[hydrate(vote) for vote in votes])
+
+    async def _resume_vote(self, vote_data: Vote, issues: Optional[Dict[int, Optional[Issue]]] = None) \
+            -> Optional[Vote]:
         # reload vote data
-        vote = await self.vote_machine.load_vote(vote_data, self.bot)
+        LOG.info(f"Resuming vote on PR #{vote_data._issue_id} in {vote_data.config.github.repo_name}")
+        vote = await self.vote_machine.load_vote(vote_data, issues)
         if vote is None:
             LOG.warning(
                 f"Unable to resume vote on PR #{vote_data._issue_id} in {vote_data.config.github.repo_name}. It may have been cancelled")
             await self.vote_db.remove(vote_data)
-            return
 
-        # resume vote execution
+        return vote
+
+    def _track_poll(self, vote: Vote):
+        self.polls[vote._poll_id.msg_id] = vote
+
+    def _untrack_poll(self, vote: Vote):
+        if self.polls.get(vote._poll_id.msg_id) is vote:
+            del self.polls[vote._poll_id.msg_id]
+        if self.refresher is not None:
+            self.refresher.forget(vote._poll_id.channel_id, vote._poll_id.msg_id)
+
+    def _schedule_end(self, vote: Vote):
+        key = (vote._poll_id.channel_id, vote._poll_id.msg_id)
+        LOG.debug(f"Vote {vote} ends in {vote.remaining_seconds()} seconds")
+        self._track_poll(vote)
+        self.scheduler.schedule(key, vote.period_end, partial(self._end_vote, vote))
+
+    async def _end_vote(self, vote: Vote, refresh_issue: bool = True):
         try:
-            await self.vote_machine.resume_vote(vote)
+            # of several channels voting on a PR, the vote ending last sets the result label
+            await self.vote_machine.end_vote(vote, await self.vote_db.ends_last(vote), refresh_issue)
         except Interrupted:
             return
+        finally:
+            self._untrack_poll(vote)
+
+        # move finished vote into the history, cancelled votes are just deleted
+        if vote.exists:
+            await self.vote_db.archive(vote)
+        else:
+            await self.vote_db.remove(vote)
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
+        self._on_reaction(payload, 1)
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
+        self._on_reaction(payload, -1)
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_clear(self, payload: discord.RawReactionClearEvent):
+        vote = self.polls.get(payload.message_id)
+        if vote is not None:
+            vote.poll.clear_reactions()
+            self._refresh_poll(vote)
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_clear_emoji(self, payload: discord.RawReactionClearEmojiEvent):
+        vote = self.polls.get(payload.message_id)
+        if vote is not None:
+            vote.poll.clear_reactions(str(payload.emoji))
+            self._refresh_poll(vote)
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        self.resolver.invalidate(payload.message_id)
+        self._on_poll_deleted(payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        for msg_id in payload.message_ids:
+            self.resolver.invalidate(msg_id)
+            self._on_poll_deleted(msg_id)
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        self.resolver.invalidate(payload.message_id)
+
+    def _on_reaction(self, payload: discord.RawReactionActionEvent, delta: int):
+        # O(1) lookup, this runs for every reaction the bot can see
+        vote = self.polls.get(payload.message_id)
+        if vote is None or vote.poll is None:
+            return
 
-        # delete old vote data
-        await self.vote_db.remove(vote)
+        # the bot's own reactions are the vote buttons, not votes
+        if self.bot.user is not None and payload.user_id == self.bot.user.id:
+            return
+
+        if vote.poll.apply_reaction(str(payload.emoji), delta):
+            LOG.debug(f"Vote {vote} tally is now aye={vote.poll.aye_count}, nay={vote.poll.nay_count}")
+            self._refresh_poll(vote)
+
+    def _refresh_poll(self, vote: Vote):
+        # show the new tally on the poll message (debounced)
+        if self.refresher is not None and vote.config.discord.refresh_seconds > 0:
+            self.refresher.mark(vote)
+
+    def _on_poll_deleted(self, msg_id: int):
+        vote = self.polls.get(msg_id)
+        if vote is None or vote.poll is None:
+            return
+
+        # vote is cancelled, it gets cleaned up when its deadline comes around
+        LOG.info(f"Poll message of vote {vote} was deleted")
+        vote.poll.msg = None
+        if self.refresher is not None:
+            self.refresher.forget(vote.poll.id.channel_id, msg_id)
 
     @vote.command(name="list")
-    async def list_votes(self, ctx: Context):
-        """List any running votes (votes persisted in db) """
+    async def list_votes(self, ctx: Context, repo_name: Optional[str] = None):
+        """List running votes (votes persisted in db), soonest ending first. Optionally only votes on a repo."""
 
         with ctx.typing():
-            votes: [Vote] = await self.vote_db.list()
+            votes, next_page = await self.vote_db.query(repo=repo_name, limit=LIST_VOTES_LIMIT)
 
             lines = [
                 f"[PR #{vote._issue_id} in {vote.config.github.repo_name}](https://github.com/{vote.config.github.repo_name}/pull/{vote._issue_id}) - open for {vote.remaining_seconds()} seconds"
                 for vote in votes
             ]
+            if next_page is not None:
+                remaining = await self.vote_db.count(repo=repo_name) - len(votes)
+                lines.append(f"...and {remaining} more")
 
             text = "\n".join(lines) if len(lines) > 0 else "no votes"
             embed = discord.Embed()
             embed.add_field(name="--Running Votes--", value=text)
             await ctx.send(embed=embed)
 
+    @vote.command(name="stats")
+    async def vote_stats(self, ctx: Context, name: Optional[str] = None):
+        """Vote history stats of a repo (owner/name) or a PR author. Defaults to this channel's repo."""
+        if name is None:
+            name = (await self._channel_config(ctx.channel)).github.repo_name
+        if name is None or len(name) == 0:
+            await ctx.send("`Set 'repo_name' or pass a repo/author`")
+            return
+
+        scope = "repo" if "/" in name else "author"
+        stats = await self.vote_db.stats(scope, name)
+        if stats is None:
+            await ctx.send(f"`No finished votes for {scope} '{name}'`")
+            return
+
+        embed = discord.Embed()
+        embed.title = f"Vote stats - {name}"
+        embed.add_field(name="Votes", value=str(stats.votes))
+        embed.add_field(name="Accepted", value=f"{stats.accepted} ({stats.acceptance_rate:.0%})")
+        embed.add_field(name="Median turnout", value=str(stats.median_turnout))
+        embed.add_field(name="Votes per week", value=f"{stats.votes_per_week:.1f}")
+        embed.add_field(name="Average duration",
+                        value=pretty_print_timedelta(datetime.timedelta(seconds=stats.average_duration)) or "0 sec")
+        await ctx.send(embed=embed)
+
+    @vote.command(name="export")
+    @checks.is_owner()
+    async def export_votes(self, ctx: Context, fmt: str = "csv", since: Optional[str] = None,
+                           until: Optional[str] = None, repo_name: Optional[str] = None):
+        """Export vote history to a compressed csv/jsonl file in the cog data dir. Dates are YYYY-MM-DD."""
+        if fmt not in EXPORT_FORMATS:
+            await ctx.send(f"`Unknown format '{fmt}', use one of: {', '.join(EXPORT_FORMATS)}`")
+            return
+
+        try:
+            since_ts = _parse_date(since)
+            until_ts = _parse_date(until)
+        except ValueError:
+            await ctx.send("`Dates must be formatted YYYY-MM-DD`")
+            return
+
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        out_path = cog_data_path(self) / "exports" / f"vote_history_{stamp}.{fmt}.gz"
+
+        # run the export off the event loop, reporting progress as it goes
+        rows = [0]
+        msg = await ctx.send("`Exporting vote history...`")
+        export = asyncio.create_task(export_history_async(
+            self.vote_db.path, out_path, fmt, since_ts, until_ts, repo_name,
+            progress=lambda count: rows.__setitem__(0, count)))
+        while not export.done():
+            await asyncio.wait([export], timeout=EXPORT_PROGRESS_SECONDS)
+            if not export.done():
+                await msg.edit(content=f"`Exporting vote history... {rows[0]} rows`")
+
+        try:
+            count = export.result()
+        except Exception:
+            LOG.exception("Error exporting vote history")
+            await msg.edit(content="`Export failed, see logs`")
+            return
+
+        await msg.edit(content=f"`Exported {count} votes to {out_path}`")
+
+    @vote.command(name="status")
+    @checks.is_owner()
+    async def status(self, ctx: Context):
+        """Print cog runtime status (webhook queue, Github rate limit budget, caches, resume progress, vote db)"""
+        lines = []
+
+        # webhook
+        lines.append("#Webhook")
+        if self.webhook is not None and self.webhook.running:
+            deliveries = self.webhook.deliveries
+            lines.append(f"queue_depth={self.webhook.queue_depth}")
+            lines.append(f"dropped={self.webhook.dropped}")
+            lines.append(f"dedup_hits={deliveries.hits}")
+            lines.append(f"dedup_misses={deliveries.misses}")
+        else:
+            lines.append("running=False")
+
+        # github
+        lines.append("")
+        lines.append("#Github")
+        if self.vote_machine is not None:
+            cache = self.vote_machine.client.cache
+            limiter = self.vote_machine.client.limiter
+            lines.append(f"rate_limit={limiter}")
+            lines.append(f"rate_limit_delayed={limiter.delayed}")
+            lines.append(f"rate_limit_retried={limiter.retried}")
+            lines.append(f"cache_entries={len(cache.entries)}")
+            lines.append(f"cache_hits={cache.hits}")
+            lines.append(f"cache_misses={cache.misses}")
+        else:
+            lines.append("api_token=")
+
+        # startup resume
+        lines.append("")
+        lines.append("#Resume")
+        lines.append(f"progress={self.resume_progress}")
+
+        # vote deadlines
+        next_deadline = self.scheduler.next_deadline
+        lines.append("")
+        lines.append("#Votes")
+        lines.append(f"scheduled={len(self.scheduler)}")
+        lines.append(f"ending={len(self.scheduler.running)}")
+        lines.append(f"live={len(self.polls)}")
+        lines.append(f"refresh={self.refresher}")
+        lines.append(f"messages={self.resolver}")
+        if next_deadline is not None:
+            lines.append(f"next_end_in={max(0, int(next_deadline - time.time()))}s")
+
+        # vote db
+        lines.append("")
+        lines.append("#VoteDB")
+        if self.vote_db is not None:
+            lines.append(f"jobs={self.vote_db.jobs}")
+            lines.append(f"batches={self.vote_db.batches}")
+        lines.append(f"export={EXPORT_POOL}")
+        lines.append(f"blocking={BLOCKING_POOL}")
+
+        status_text = "\n".join(lines)
+        await ctx.send(f"```ini\n{status_text}\n```")
+
     @vote.command(name="clear")
     @checks.is_owner()
     async def clear_votes(self, ctx: Context):
@@ -244,14 +642,17 @@ class VoteCog(commands.Cog):
 
         # set conf
         delete_msg = "api_token" in key or "secret" in key
-        await self._set_conf(ctx, key, value, self.config, GlobalConfig(), delete_msg=delete_msg)
+        if await self._set_conf(ctx, key, value, self.config, GlobalConfig, delete_msg=delete_msg):
+            conf = self.global_conf.copy()
+            conf.set(key, value)
+            self.global_conf = conf.freeze()
 
     @vote.command(name="get")
     @checks.is_owner()
     async def get_global_conf(self, ctx: Context):
         """Print global config"""
-        # load conf
-        conf = await self._global_config()
+        # copy, the snapshot is shared
+        conf = self.global_conf.copy()
 
         # hide api token
         api_token = conf.github.api_token
@@ -282,19 +683,11 @@ class VoteCog(commands.Cog):
             await self.get_channel_conf(ctx)
             return
 
-        # keep repo_lookup in sync
-        old_repo_name = await raw_config.github.repo_name()
-
-        # set conf
-        await self._set_conf(ctx, key, value, raw_config, ChannelConfig())
-
-        # keep repo_lookup in sync
-        conf = await raw_config.all(acquire_lock=False)
-        conf = ChannelConfig().from_dict(conf)
-        if conf.github.repo_name is not None and len(conf.github.repo_name) > 0:
-            self.repo_lookup[conf.github.repo_name] = conf
-        if old_repo_name != conf.github.repo_name:
-            self.repo_lookup.pop(old_repo_name, None)
+        # set conf, write through to the cache
+        if await self._set_conf(ctx, key, value, raw_config, ChannelConfig):
+            conf = (await self._channel_config(ctx.channel)).copy()
+            conf.set(key, value)
+            self.channel_configs.put(ctx.channel.id, conf)
 
     @channel.command(name="get")
     async def get_channel_conf(self, ctx: Context):
@@ -306,24 +699,17 @@ class VoteCog(commands.Cog):
         # print conf
         await self._get_conf(ctx, conf)
 
-    async def _global_config(self) -> GlobalConfig:
-        conf = await self.config.all(acquire_lock=False)
-        conf = GlobalConfig().from_dict(conf)
-
-        return conf
-
     async def _channel_config(self, channel: TextChannel) -> ChannelConfig:
-        # load config
-        raw_conf = self.config.channel(channel)
-        conf = await raw_conf.all(acquire_lock=False)
-        conf = ChannelConfig().from_dict(conf)
-
-        # set channel_id, if it hasn't been set already
-        if conf.discord.channel_id is None:
-            conf.discord.channel_id = channel.id
-            await raw_conf.discord.channel_id.set(channel.id)
+        """Shared (frozen) config snapshot of a channel"""
+        conf = self.channel_configs.get(channel.id)
+        if conf is not None:
+            return conf
 
-        return conf
+        # first use of this channel, store its channel_id
+        conf = ChannelConfig()
+        conf.discord.channel_id = channel.id
+        await self.config.channel(channel).discord.channel_id.set(channel.id)
+        return self.channel_configs.put(channel.id, conf)
 
     async def _get_conf(self, ctx: Context, config: BaseConfig):
         # serialize to string
@@ -343,23 +729,33 @@ class VoteCog(commands.Cog):
         await ctx.send(f"```ini\n{config_text}\n```")
 
     async def _set_conf(self, ctx: Context, key: str, value: str, config: Union[Config, redbot.core.config.Group],
-                        valid_keys: BaseConfig, delete_msg: bool = False):
+                        schema: Type[BaseConfig], delete_msg: bool = False) -> bool:
         # check if the key being set is known
-        valid_keys = {key for _, key, _ in valid_keys.walk()}
-        if key not in valid_keys:
+        field = schema.field(key)
+        if field is None:
             await asyncio.gather(
                 ctx.message.add_reaction("❌"),
                 ctx.send(f"`Unknown key: '{key}'`")
             )
-            return
+            return False
 
         # check if key is protected
-        if is_protected_key(key):
+        if field.protected:
             await asyncio.gather(
                 ctx.message.add_reaction("❌"),
                 ctx.send(f"`Not set here: '{key}'`")
             )
-            return
+            return False
+
+        # check the value, it's stored typed
+        try:
+            value = field.coerce(value)
+        except ValueError as err:
+            await asyncio.gather(
+                ctx.message.add_reaction("❌"),
+                ctx.send(f"`Invalid value: {err}`")
+            )
+            return False
 
         # prepare update actions
         actions = [
@@ -373,3 +769,10 @@ class VoteCog(commands.Cog):
 
         # execute
         await asyncio.gather(*actions)
+        return True
+
+
+def _parse_date(date: Optional[str]) -> Optional[int]:
+    if date is None:
+        return None
+    return int(datetime.datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc).timestamp())
@@ -1,116 +1,274 @@
-from typing import Optional
+from operator import attrgetter
+from typing import Optional, Any, Tuple, Dict, Callable
+
+from git_vote_cog.util import LOG
+
+# accepted spellings of config booleans
+TRUE_VALUES = ("true", "on", "yes", "1")
+FALSE_VALUES = ("false", "off", "no", "0", "")
+
+
+class Field:
+    """Declares a config value: its type, default and how it may be set. A BaseConfig subclass as the type declares a
+    nested config section."""
+
+    def __init__(self, type: type, default: Any = None, protected: bool = False, choices: Optional[tuple] = None,
+                 minimum: Optional[int] = None):
+        self.type = type
+        self.default = default
+        self.protected = protected  # not settable through commands
+        self.choices = choices
+        self.minimum = minimum
+        self.section = isinstance(type, ConfigMeta)
+        self.nullable = default is None and not self.section
+        self.name: str = ""
+
+    def coerce(self, value: Any) -> Any:
+        """Validate and convert a value (possibly a string typed in discord) to the field's type"""
+        if self.section:
+            if not isinstance(value, self.type):
+                raise ValueError(f"'{self.name}' is a config section")
+            return value
+
+        if value is None or (self.nullable and isinstance(value, str) and value.strip().lower() in ("", "none")):
+            if not self.nullable:
+                raise ValueError(f"'{self.name}' can't be empty")
+            return None
+
+        if self.type is bool:
+            if isinstance(value, str):
+                if value.strip().lower() in TRUE_VALUES:
+                    value = True
+                elif value.strip().lower() in FALSE_VALUES:
+                    value = False
+                else:
+                    raise ValueError(f"'{self.name}' must be true or false")
+            value = bool(value)
+        elif self.type is int:
+            try:
+                if isinstance(value, float) and not value.is_integer():
+                    raise ValueError()
+                value = int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"'{self.name}' must be a whole number")
+        else:
+            value = self.type(value)
+
+        if self.choices is not None and value not in self.choices:
+            raise ValueError(f"'{self.name}' must be one of {', '.join(map(str, self.choices))}")
+        if self.minimum is not None and value < self.minimum:
+            raise ValueError(f"'{self.name}' must be at least {self.minimum}")
+        return value
+
+
+class ConfigMeta(type):
+    """Compiles a config class's Field declarations once, when the class is created: fields become slots, and the
+    flattened keys (as used by the set/get commands) are precomputed with their accessors."""
+
+    def __new__(mcs, name, bases, namespace):
+        fields = [(k, v) for k, v in namespace.items() if isinstance(v, Field)]
+        for k, _ in fields:
+            del namespace[k]
+        namespace.setdefault("__slots__", tuple(k for k, _ in fields))
+        cls = super().__new__(mcs, name, bases, namespace)
+
+        inherited = getattr(cls, "_fields", ())
+        for k, field in fields:
+            field.name = k
+        cls._fields = inherited + tuple(field for _, field in fields)
+        cls._field_map = {field.name: field for field in cls._fields}
+
+        # flattened keys in display order: (section class for a section's first key or None, key, accessor, field)
+        keys = []
+        section_start = cls
+        for field in cls._fields:
+            if field.section:
+                for start, key, _, leaf in field.type._keys:
+                    keys.append((start, f"{field.name}.{key}", attrgetter(f"{field.name}.{key}"), leaf))
+            else:
+                keys.append((section_start, field.name, attrgetter(field.name), field))
+                section_start = None
+        cls._keys = tuple(keys)
+        cls._key_map = {key: leaf for _, key, _, leaf in keys}
+        return cls
+
+
+class BaseConfig(metaclass=ConfigMeta):
+    __slots__ = ("_frozen",)
+
+    _fields: Tuple[Field, ...]
+    _field_map: Dict[str, Field]
+    _keys: Tuple[Tuple[Optional[type], str, Callable[[Any], Any], Field], ...]
+    _key_map: Dict[str, Field]
+
+    def __init__(self):
+        object.__setattr__(self, "_frozen", False)
+        for field in self._fields:
+            object.__setattr__(self, field.name, field.type() if field.section else field.default)
+
+    def __setattr__(self, key, value):
+        # frozen configs are shared snapshots, they are replaced instead of modified
+        if self._frozen:
+            raise AttributeError(f"{type(self).__name__} is frozen, set '{key}' on a copy")
+        field = self._field_map.get(key)
+        if field is None:
+            raise AttributeError(f"{type(self).__name__} has no field '{key}'")
+        object.__setattr__(self, key, field.coerce(value))
+
+    @classmethod
+    def field(cls, key: str) -> Optional[Field]:
+        """Field of a (dotted) key, None if there's no such key"""
+        return cls._key_map.get(key)
+
+    def freeze(self):
+        for field in self._fields:
+            if field.section:
+                getattr(self, field.name).freeze()
+        object.__setattr__(self, "_frozen", True)
+        return self
 
+    def copy(self):
+        """Modifiable deep copy"""
+        other = type(self)()
+        for field in self._fields:
+            val = getattr(self, field.name)
+            object.__setattr__(other, field.name, val.copy() if field.section else val)
+        return other
+
+    def set(self, key: str, value):
+        """Set a value by its dotted key"""
+        *path, name = key.split(".")
+        obj = self
+        for k in path:
+            obj = getattr(obj, k)
+        setattr(obj, name, value)
 
-class BaseConfig:
     def to_dict(self) -> dict:
         vals = dict()
-        for k, v in self.__dict__.items():
-            if isinstance(v, BaseConfig):
-                vals[k] = v.to_dict()
-            else:
-                vals[k] = v
+        for field in self._fields:
+            val = getattr(self, field.name)
+            vals[field.name] = val.to_dict() if field.section else val
 
         return vals
 
     def from_dict(self, vals: dict):
-        my_vals = self.__dict__
-        for k, v in my_vals.items():
-            other_val = vals.get(k)
+        for field in self._fields:
+            other_val = vals.get(field.name)
             if other_val is None:
                 continue
 
-            if isinstance(v, BaseConfig):
+            if field.section:
                 if isinstance(other_val, dict):
-                    v.from_dict(other_val)
+                    getattr(self, field.name).from_dict(other_val)
             else:
-                my_vals[k] = other_val
+                try:
+                    setattr(self, field.name, other_val)
+                except ValueError as err:
+                    LOG.warning(f"Ignoring stored config value {type(self).__name__}.{field.name}={other_val!r}: {err}")
 
         return self
 
-    def walk(self, prefix: str = "", sep: str = "."):
-        obj_start: Optional[object] = self
-        for k, v in self.__dict__.items():
-            if isinstance(v, BaseConfig):
-                next_prefix = f"{k}{sep}" if len(prefix) == 0 else f"{prefix}{k}{sep}"
-
-                yield from v.walk(next_prefix, sep)
-            else:
-                yield obj_start, f"{prefix}{k}", v
-                obj_start = None
+    def walk(self):
+        """(section, key, value) of every value, section is set on the first value of each config section"""
+        for section, key, getter, _ in self._keys:
+            yield section, key, getter(self)
 
 
 class WebhookConfig(BaseConfig):
     """Github Webhook setup"""
 
-    def __init__(self):
-        self.host: Optional[str] = None
-        self.port: int = 5000
-        self.path: str = "/github/webhook"
-        self.secret: str = ""
-        self.on: bool = False
+    host = Field(str)
+    port = Field(int, 5000)
+    path = Field(str, "/github/webhook")
+    secret = Field(str, "")
+    on = Field(bool, False)
+    queue_size = Field(int, 100, minimum=1)
+    workers = Field(int, 2, minimum=1)
+    overflow = Field(str, "drop_oldest", choices=("drop_oldest", "drop_newest"))
+    dedup_size = Field(int, 1000, minimum=1)
+    dedup_ttl_seconds = Field(int, 3600, minimum=0)
+    dedup_persist = Field(bool, False)
+    max_body_bytes = Field(int, 1024 ** 2, minimum=1)
+    offload_bytes = Field(int, 64 * 1024, minimum=0)
+    fanout = Field(int, 4, minimum=1)
 
 
 class GithubGlobalConfig(BaseConfig):
     """Github API setup"""
 
-    def __init__(self):
-        self.api_token: str = ""
-        self.webhook: WebhookConfig = WebhookConfig()
+    api_token = Field(str, "")
+    connections = Field(int, 10, minimum=1)
+    cache_size = Field(int, 256, minimum=1)
+    cache_persist = Field(bool, False)
+    rate_reserve = Field(int, 100, minimum=0)
+    max_retries = Field(int, 3, minimum=0)
+    graphql_batch_size = Field(int, 50, minimum=1)
+    webhook = Field(WebhookConfig)
+
+
+class DatabaseConfig(BaseConfig):
+    """Vote database setup"""
+
+    synchronous = Field(str, "NORMAL", choices=("OFF", "NORMAL", "FULL", "EXTRA"))
+
+
+class ResumeConfig(BaseConfig):
+    """Resuming persisted votes on startup"""
+
+    concurrency = Field(int, 8, minimum=1)
+    batch_size = Field(int, 50, minimum=1)
+    hydrate_lead_seconds = Field(int, 60, minimum=0)
 
 
 class GlobalConfig(BaseConfig):
     """Global cog config"""
 
-    def __init__(self):
-        self.github = GithubGlobalConfig()
+    github = Field(GithubGlobalConfig)
+    db = Field(DatabaseConfig)
+    resume = Field(ResumeConfig)
 
 
 class Labels(BaseConfig):
     """Github Labels, applied to PullRequests, that this cog will add/remove."""
 
-    def __init__(self):
-        self.needs_vote: str = "needs_vote"
-        self.vote_in_progress: str = "vote_in_progress"
-        self.vote_accepted: str = "vote_accepted"
-        self.vote_rejected: str = "vote_rejected"
+    needs_vote = Field(str, "needs_vote")
+    vote_in_progress = Field(str, "vote_in_progress")
+    vote_accepted = Field(str, "vote_accepted")
+    vote_rejected = Field(str, "vote_rejected")
 
 
 class MediaConfig(BaseConfig):
     """Change how the discord messages look"""
 
-    def __init__(self):
-        self.aye_vote_emoji: str = "👍"
-        self.nay_vote_emoji: str = "👎"
-        self.vote_rejected_icon: str = "https://domains.byu.edu/help/lib/exe/fetch.php?cache=&media=red-x-mark-transparent-background.png"
-        self.vote_accepted_icon: str = "https://rlv.zcache.com/green_check_mark_symbol_classic_round_sticker-rd595add23fee473ca44c12c0a1bdcd36_0ugmp_8byvr_704.jpg"
-        self.vote_start_icon: str = "https://m.media-amazon.com/images/I/51q83-k4w7L._AC_SY355_.jpg"
+    aye_vote_emoji = Field(str, "👍")
+    nay_vote_emoji = Field(str, "👎")
+    vote_rejected_icon = Field(str, "https://domains.byu.edu/help/lib/exe/fetch.php?cache=&media=red-x-mark-transparent-background.png")
+    vote_accepted_icon = Field(str, "https://rlv.zcache.com/green_check_mark_symbol_classic_round_sticker-rd595add23fee473ca44c12c0a1bdcd36_0ugmp_8byvr_704.jpg")
+    vote_start_icon = Field(str, "https://m.media-amazon.com/images/I/51q83-k4w7L._AC_SY355_.jpg")
 
 
 class DiscordConfig(BaseConfig):
     """Discord message setup"""
 
-    def __init__(self):
-        self.voting_period_seconds: int = 10
-        self.channel_id: Optional[int] = None
-        self.media: MediaConfig = MediaConfig()
+    voting_period_seconds = Field(int, 10, minimum=1)
+    channel_id = Field(int, protected=True)
+    verify_tally = Field(bool, True)  # re-fetch the poll message when a vote ends, the live tally can drift
+    refresh_seconds = Field(int, 5, minimum=0)  # min seconds between edits of a poll showing its live tally, 0 is off
+    refresh_channel_edits = Field(int, 4, minimum=1)  # poll edits per refresh_seconds, shared by a channel's polls
+    count_voters = Field(bool, False)  # final tally counts voters (no bots, no double votes) instead of reactions
+    duplicate_votes = Field(str, "drop", choices=("drop", "aye", "nay", "count_both"))  # voters who voted aye and nay
+    media = Field(MediaConfig)
 
 
 class GithubChannelConfig(BaseConfig):
     """Channel github repo"""
 
-    def __init__(self):
-        self.repo_name: Optional[str] = None
-        self.labels: Labels = Labels()
+    repo_name = Field(str)
+    labels = Field(Labels)
 
 
 class ChannelConfig(BaseConfig):
     """Channel config"""
 
-    def __init__(self):
-        self.discord = DiscordConfig()
-        self.github = GithubChannelConfig()
-
-
-def is_protected_key(key: str) -> bool:
-    # return key.endswith("on") or key.endswith("_id")
-    return key.endswith("_id")
+    discord = Field(DiscordConfig)
+    github = Field(GithubChannelConfig)
@@ -1,83 +1,545 @@
+import asyncio
+import hashlib
 import json
+import queue
 import sqlite3
+import threading
+from functools import wraps
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Tuple, AsyncIterator, Dict
 
 from git_vote_cog.config import ChannelConfig
 from git_vote_cog.polls import PollId
-from git_vote_cog.util import wrap_async
+from git_vote_cog.util import LOG, BLOCKING_POOL
 from git_vote_cog.votes import Vote
 
 
+# (period_end, id) of the last vote on a page
+Cursor = Tuple[int, int]
+
+
+def _config_json(config: ChannelConfig) -> (str, str):
+    config_json = json.dumps(config.to_dict(), sort_keys=True)
+    return config_json, hashlib.sha256(config_json.encode('UTF-8')).hexdigest()
+
+
+def _migration_1(con: sqlite3.Connection):
+    """vote and webhook delivery tables"""
+    con.execute('''
+        create table if not exists vote (
+            issue_id int,
+            channel_id int,
+            message_id int,
+            period_start int,
+            period_end int,
+            config_json text
+        )
+    ''')
+    con.execute('''
+        create table if not exists delivery (
+            delivery_id text primary key,
+            received int
+        )
+    ''')
+    con.execute("create index if not exists delivery_received on delivery (received)")
+
+
+def _migration_2(con: sqlite3.Connection):
+    """vote primary key and indexes, configs deduplicated into a table keyed by content hash"""
+    con.execute('''
+        create table config (
+            hash text primary key,
+            config_json text not null
+        )
+    ''')
+    con.execute('''
+        create table vote_v2 (
+            id integer primary key,
+            repo text,
+            issue_id int not null,
+            channel_id int not null,
+            message_id int not null,
+            period_start int not null,
+            period_end int not null,
+            config_hash text not null references config (hash)
+        )
+    ''')
+
+    # move existing votes over, stored configs are copied as they are (not re-serialized by the current config class)
+    rows = con.execute("select issue_id, channel_id, message_id, period_start, period_end, config_json from vote")
+    for (issue_id, channel_id, message_id, period_start, period_end, config_json) in rows.fetchall():
+        config_hash = hashlib.sha256(config_json.encode('UTF-8')).hexdigest()
+        repo_name = (json.loads(config_json).get("github") or {}).get("repo_name")
+        con.execute("insert or ignore into config (hash, config_json) values (?, ?)", [config_hash, config_json])
+        con.execute(
+            '''
+            insert into vote_v2 (repo, issue_id, channel_id, message_id, period_start, period_end, config_hash)
+            values (?, ?, ?, ?, ?, ?, ?)
+            ''',
+            [repo_name, issue_id, channel_id, message_id, period_start, period_end, config_hash]
+        )
+
+    con.execute("drop table vote")
+    con.execute("alter table vote_v2 rename to vote")
+    con.execute("create index vote_message on vote (channel_id, message_id)")
+    con.execute("create index vote_issue on vote (repo, issue_id)")
+    con.execute("create index vote_period_end on vote (period_end)")
+    con.execute("create index vote_config on vote (config_hash)")
+
+
+def _migration_3(con: sqlite3.Connection):
+    """vote history, with per-repo/per-author aggregates"""
+    con.execute('''
+        create table vote_history (
+            id integer primary key,
+            repo text not null,
+            issue_id int not null,
+            author text not null,
+            channel_id int not null,
+            message_id int not null,
+            outcome text not null,
+            aye_count int not null,
+            nay_count int not null,
+            period_start int not null,
+            period_end int not null
+        )
+    ''')
+    con.execute("create index vote_history_period_end on vote_history (period_end)")
+    con.execute("create index vote_history_repo on vote_history (repo, period_end)")
+
+    # aggregates, maintained on insert. scope is 'repo' or 'author'
+    con.execute('''
+        create table vote_stats (
+            scope text not null,
+            key text not null,
+            votes int not null,
+            accepted int not null,
+            turnout int not null,
+            duration int not null,
+            first_end int not null,
+            last_end int not null,
+            primary key (scope, key)
+        )
+    ''')
+
+    # turnout histogram, for medians
+    con.execute('''
+        create table vote_turnout (
+            scope text not null,
+            key text not null,
+            turnout int not null,
+            votes int not null,
+            primary key (scope, key, turnout)
+        )
+    ''')
+
+
+def _migration_4(con: sqlite3.Connection):
+    """tally completeness, votes counted until the outcome was settled are left out of turnout stats"""
+    con.execute("alter table vote_history add column complete int not null default 1")
+    con.execute("alter table vote_stats add column counted int not null default 0")
+    con.execute("update vote_stats set counted = votes")
+
+
+# schema migrations, in order. The db's `user_version` is the number of migrations applied.
+MIGRATIONS = [
+    _migration_1,
+    _migration_2,
+    _migration_3,
+    _migration_4,
+]
+
+
+class VoteStats:
+    """Aggregated vote history of a repo or a PR author"""
+
+    def __init__(self, scope: str, key: str, votes: int, accepted: int, turnout: int, counted: int, duration: int,
+                 first_end: int, last_end: int, median_turnout: int):
+        self.scope = scope
+        self.key = key
+        self.votes = votes
+        self.accepted = accepted
+        self.turnout = turnout
+        self.counted = counted  # votes with a complete tally, the ones turnout covers
+        self.duration = duration
+        self.first_end = first_end
+        self.last_end = last_end
+        self.median_turnout = median_turnout
+
+    @property
+    def acceptance_rate(self) -> float:
+        return self.accepted / self.votes if self.votes > 0 else 0.0
+
+    @property
+    def votes_per_week(self) -> float:
+        weeks = max(1.0, (self.last_end - self.first_end) / (7 * 24 * 60 * 60))
+        return self.votes / weeks
+
+    @property
+    def average_duration(self) -> int:
+        return self.duration // self.votes if self.votes > 0 else 0
+
+
+def _queued(func):
+    """Run a VoteDB method on the db thread, passing it the db connection"""
+
+    @wraps(func)
+    async def run(self: 'VoteDB', *args, **kwargs):
+        return await self._submit(lambda con: func(self, con, *args, **kwargs))
+
+    return run
+
+
+def _resolve(future: asyncio.Future, result, err: Optional[BaseException]):
+    if future.cancelled():
+        return
+    if err is not None:
+        future.set_exception(err)
+    else:
+        future.set_result(result)
+
+
 class VoteDB:
-    def __init__(self, dir: Path):
+    """Vote storage. One long-lived connection (WAL mode) is owned by a dedicated thread, calls queued up while it is
+    busy are run together in a single transaction (group commit)."""
+
+    def __init__(self, dir: Path, synchronous: str = "NORMAL"):
         self.dir = dir
+        self.synchronous = synchronous  # validated by DatabaseConfig
         self.con: Optional[sqlite3.Connection] = None
+        self._jobs: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._configs: Dict[str, ChannelConfig] = {}
+
+        # stats
+        self.jobs: int = 0
+        self.batches: int = 0
+
+    @property
+    def path(self) -> Path:
+        return self.dir / 'votes.db'
 
     def _open(self) -> sqlite3.Connection:
-        path = self.dir / 'votes.db'
-        con = sqlite3.connect(str(path))
+        con = sqlite3.connect(str(self.path), isolation_level=None, check_same_thread=False)
+        con.execute("pragma journal_mode = wal")
+        con.execute(f"pragma synchronous = {self.synchronous}")
 
         return con
 
-    @wrap_async
-    def init(self):
-        with self._open() as con:
-            con.execute('''
-                create table if not exists vote (
-                    issue_id int,
-                    channel_id int,
-                    message_id int,
-                    period_start int,
-                    period_end int,
-                    config_json text
-                )
-            ''')
-
-    @wrap_async
-    def persist(self, vote: Vote):
-        config_json = json.dumps(vote.config.to_dict())
-
-        with self._open() as con:
+    def _run(self):
+        self.con = self._open()
+        try:
+            stop = False
+            while not stop:
+                batch = [self._jobs.get()]
+
+                # group commit: take everything queued up meanwhile
+                while True:
+                    try:
+                        batch.append(self._jobs.get_nowait())
+                    except queue.Empty:
+                        break
+
+                if None in batch:
+                    stop = True
+                    batch = [job for job in batch if job is not None]
+                if len(batch) > 0:
+                    self._execute(batch)
+        finally:
+            self.con.close()
+            self.con = None
+
+    def _execute(self, batch):
+        results = []
+        try:
+            self.con.execute("begin")
+            for func, future, loop in batch:
+                # savepoint per job, so a failing job doesn't take the rest of the batch with it
+                self.con.execute("savepoint job")
+                try:
+                    result = func(self.con)
+                    self.con.execute("release job")
+                    results.append((future, loop, result, None))
+                except Exception as err:
+                    self.con.execute("rollback to job")
+                    self.con.execute("release job")
+                    results.append((future, loop, None, err))
+            self.con.execute("commit")
+        except Exception as err:
+            LOG.exception("Error committing vote db batch")
+            if self.con.in_transaction:
+                self.con.execute("rollback")
+            results = [(future, loop, None, err) for _, future, loop in batch]
+
+        self.jobs += len(batch)
+        self.batches += 1
+        for future, loop, result, err in results:
+            loop.call_soon_threadsafe(_resolve, future, result, err)
+
+    async def _submit(self, func):
+        if self._thread is None:
+            raise RuntimeError("VoteDB is not open")
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._jobs.put((func, future, loop))
+        return await future
+
+    async def init(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="git-vote-cog-db", daemon=True)
+            self._thread.start()
+
+        await self._migrate()
+
+    async def close(self):
+        if self._thread is None:
+            return
+
+        thread = self._thread
+        self._thread = None
+        self._jobs.put(None)
+        await BLOCKING_POOL.run(thread.join)
+
+    @_queued
+    def _migrate(self, con: sqlite3.Connection):
+        version = con.execute("pragma user_version").fetchone()[0]
+        for i, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            LOG.info(f"Migrating vote db to version {i}: {migration.__doc__}")
+            migration(con)
+            con.execute(f"pragma user_version = {i}")
+
+    @_queued
+    def persist(self, con: sqlite3.Connection, vote: Vote):
+        config_json, config_hash = _config_json(vote.config)
+
+        con.execute("insert or ignore into config (hash, config_json) values (?, ?)", [config_hash, config_json])
+        con.execute(
+            '''
+            insert into vote (repo, issue_id, channel_id, message_id, period_start, period_end, config_hash)
+            values (?, ?, ?, ?, ?, ?, ?)
+            ''',
+            [
+                vote.config.github.repo_name,
+                vote._issue_id,
+                vote._poll_id.channel_id,
+                vote._poll_id.msg_id,
+                vote.period_start, vote.period_end,
+                config_hash
+            ]
+        )
+
+    @_queued
+    def ends_last(self, con: sqlite3.Connection, vote: Vote) -> bool:
+        """No other running vote on the same PR (in another channel) ends after this one. Ties go to the later poll."""
+        row = con.execute(
+            '''
+            select 1 from vote where repo = ? and issue_id = ? and
+                (period_end > ? or (period_end = ? and message_id > ?))
+            limit 1
+            ''',
+            [vote.config.github.repo_name, vote._issue_id, vote.period_end, vote.period_end, vote._poll_id.msg_id]
+        ).fetchone()
+        return row is None
+
+    @_queued
+    def remove(self, con: sqlite3.Connection, vote: Vote):
+        self._remove(con, vote._poll_id)
+
+    @staticmethod
+    def _remove(con: sqlite3.Connection, poll_id: PollId):
+        row = con.execute("select config_hash from vote where channel_id = ? and message_id = ?",
+                          [poll_id.channel_id, poll_id.msg_id]).fetchone()
+        if row is None:
+            return
+
+        con.execute("delete from vote where channel_id = ? and message_id = ?", [poll_id.channel_id, poll_id.msg_id])
+
+        # drop the config if this was the last vote using it
+        con.execute("delete from config where hash = ? and not exists (select 1 from vote where config_hash = ?)",
+                    [row[0], row[0]])
+
+    @_queued
+    def archive(self, con: sqlite3.Connection, vote: Vote):
+        """Move a finished vote from the running votes into the history, updating the aggregates"""
+        self._remove(con, vote._poll_id)
+
+        repo = vote.config.github.repo_name
+        author = vote.issue.author
+        accepted = vote.poll.is_vote_accepted()
+        complete = vote.poll.tally_complete
+        turnout = vote.poll.aye_count + vote.poll.nay_count
+        duration = vote.period_end - vote.period_start
+        con.execute(
+            '''
+            insert into vote_history (repo, issue_id, author, channel_id, message_id, outcome, aye_count, nay_count,
+                                      period_start, period_end, complete)
+            values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''',
+            [
+                repo, vote._issue_id, author, vote._poll_id.channel_id, vote._poll_id.msg_id,
+                "accepted" if accepted else "rejected", vote.poll.aye_count, vote.poll.nay_count,
+                vote.period_start, vote.period_end, int(complete)
+            ]
+        )
+
+        # counts of a tally stopped early are partial, they'd skew the turnout
+        for scope, key in [("repo", repo), ("author", author)]:
+            con.execute(
+                '''
+                insert into vote_stats (scope, key, votes, accepted, turnout, counted, duration, first_end, last_end)
+                values (?, ?, 1, ?, ?, ?, ?, ?, ?)
+                on conflict (scope, key) do update set
+                    votes = votes + 1,
+                    accepted = accepted + excluded.accepted,
+                    turnout = turnout + excluded.turnout,
+                    counted = counted + excluded.counted,
+                    duration = duration + excluded.duration,
+                    first_end = min(first_end, excluded.first_end),
+                    last_end = max(last_end, excluded.last_end)
+                ''',
+                [scope, key, int(accepted), turnout if complete else 0, int(complete), duration, vote.period_end,
+                 vote.period_end]
+            )
+            if not complete:
+                continue
             con.execute(
                 '''
-                insert into vote (issue_id, channel_id, message_id, period_start, period_end, config_json)
-                values (?, ?, ?, ?, ?, ?)
+                insert into vote_turnout (scope, key, turnout, votes) values (?, ?, ?, 1)
+                on conflict (scope, key, turnout) do update set votes = votes + 1
                 ''',
-                [
-                    vote._issue_id,
-                    vote._poll_id.channel_id,
-                    vote._poll_id.msg_id,
-                    vote.period_start, vote.period_end,
-                    config_json
-                ]
+                [scope, key, turnout]
             )
 
-    @wrap_async
-    def remove(self, vote: Vote):
-        with self._open() as con:
-            con.execute("delete from vote where channel_id = ? and message_id = ?",
-                        [vote._poll_id.channel_id, vote._poll_id.msg_id])
-
-    @wrap_async
-    def clear(self):
-        with self._open() as con:
-            con.execute("delete from vote")
-
-    @wrap_async
-    def list(self) -> [Vote]:
-        with self._open() as con:
-            votes = []
-            for row in con.execute(
-                    "select issue_id, channel_id, message_id, period_start, period_end, config_json from vote"):
-                (issue_id, channel_id, message_id, period_start, period_end, config_json) = row
-                vote = Vote()
-                vote._issue_id = issue_id
-                vote._poll_id = PollId(channel_id, message_id)
-                vote.period_start = period_start
-                vote.period_end = period_end
-                vote.config = ChannelConfig().from_dict(json.loads(config_json))
-
-                votes.append(vote)
-
-            return votes
+    @_queued
+    def stats(self, con: sqlite3.Connection, scope: str, key: str) -> Optional[VoteStats]:
+        row = con.execute(
+            '''
+            select votes, accepted, turnout, counted, duration, first_end, last_end from vote_stats
+            where scope = ? and key = ?
+            ''',
+            [scope, key]).fetchone()
+        if row is None:
+            return None
+
+        # median from the turnout histogram (one row per distinct turnout, not per vote)
+        (votes, accepted, turnout, counted, duration, first_end, last_end) = row
+        median_turnout = 0
+        seen = 0
+        for (value, count) in con.execute(
+                "select turnout, votes from vote_turnout where scope = ? and key = ? order by turnout", [scope, key]):
+            seen += count
+            if seen * 2 >= counted:
+                median_turnout = value
+                break
+
+        return VoteStats(scope, key, votes, accepted, turnout, counted, duration, first_end, last_end, median_turnout)
+
+    @_queued
+    def clear(self, con: sqlite3.Connection):
+        con.execute("delete from vote")
+        con.execute("delete from config")
+
+    def _config(self, config_hash: str, config_json: str) -> ChannelConfig:
+        # decode each distinct config once, keyed by content hash so it never goes stale
+        config = self._configs.get(config_hash)
+        if config is None:
+            if len(self._configs) >= 1024:
+                self._configs.clear()
+            config = ChannelConfig().from_dict(json.loads(config_json)).freeze()
+            self._configs[config_hash] = config
+
+        return config
+
+    @staticmethod
+    def _filter(repo: Optional[str], channel_id: Optional[int], ending_within: Optional[int]) -> (str, list):
+        clauses, params = [], []
+        if repo is not None:
+            clauses.append("vote.repo = ?")
+            params.append(repo)
+        if channel_id is not None:
+            clauses.append("vote.channel_id = ?")
+            params.append(channel_id)
+        if ending_within is not None:
+            clauses.append("vote.period_end <= cast(strftime('%s', 'now') as int) + ?")
+            params.append(ending_within)
+
+        return " and ".join(clauses), params
+
+    @_queued
+    def query(self, con: sqlite3.Connection, repo: Optional[str] = None, channel_id: Optional[int] = None,
+              ending_within: Optional[int] = None, limit: Optional[int] = None,
+              cursor: Optional[Cursor] = None) -> ([Vote], Optional[Cursor]):
+        """Votes ordered by deadline, optionally filtered by repo/channel or to those ending within N seconds.
+        Returns a page of at most `limit` votes, plus the cursor to pass in for the next page (None on the last)."""
+        where, params = self._filter(repo, channel_id, ending_within)
+        if cursor is not None:
+            where = f"{where} and " if len(where) > 0 else ""
+            where += "(vote.period_end > ? or (vote.period_end = ? and vote.id > ?))"
+            params += [cursor[0], cursor[0], cursor[1]]
+
+        sql = '''
+            select vote.id, vote.issue_id, vote.channel_id, vote.message_id, vote.period_start, vote.period_end,
+                   config.hash, config.config_json
+            from vote join config on config.hash = vote.config_hash
+        '''
+        if len(where) > 0:
+            sql += f" where {where}"
+        sql += " order by vote.period_end, vote.id"
+        if limit is not None:
+            sql += " limit ?"
+            params.append(limit)
+
+        votes = []
+        last: Optional[Cursor] = None
+        for row in con.execute(sql, params):
+            (row_id, issue_id, channel_id, message_id, period_start, period_end, config_hash, config_json) = row
+
+            vote = Vote()
+            vote._issue_id = issue_id
+            vote._poll_id = PollId(channel_id, message_id)
+            vote.period_start = period_start
+            vote.period_end = period_end
+            vote.config = self._config(config_hash, config_json)
+
+            votes.append(vote)
+            last = (period_end, row_id)
+
+        next_cursor = last if limit is not None and len(votes) == limit else None
+        return votes, next_cursor
+
+    @_queued
+    def count(self, con: sqlite3.Connection, repo: Optional[str] = None, channel_id: Optional[int] = None,
+              ending_within: Optional[int] = None) -> int:
+        where, params = self._filter(repo, channel_id, ending_within)
+        sql = "select count(*) from vote"
+        if len(where) > 0:
+            sql += f" where {where}"
+        return con.execute(sql, params).fetchone()[0]
+
+    async def iterate(self, repo: Optional[str] = None, channel_id: Optional[int] = None,
+                      ending_within: Optional[int] = None, page_size: int = 500) -> AsyncIterator[Vote]:
+        """Stream votes in deadline order, a page at a time"""
+        cursor: Optional[Cursor] = None
+        while True:
+            votes, cursor = await self.query(repo, channel_id, ending_within, page_size, cursor)
+            for vote in votes:
+                yield vote
+            if cursor is None:
+                break
+
+    async def list(self) -> [Vote]:
+        votes, _ = await self.query()
+        return votes
+
+    @_queued
+    def has_delivery(self, con: sqlite3.Connection, delivery_id: str, since: int) -> bool:
+        row = con.execute("select 1 from delivery where delivery_id = ? and received >= ?",
+                          [delivery_id, since]).fetchone()
+        return row is not None
+
+    @_queued
+    def add_delivery(self, con: sqlite3.Connection, delivery_id: str, received: int, expired: int):
+        con.execute("insert or replace into delivery (delivery_id, received) values (?, ?)",
+                    [delivery_id, received])
+        con.execute("delete from delivery where received < ?", [expired])
@@ -0,0 +1,83 @@
+import csv
+import gzip
+import json
+import sqlite3
+from pathlib import Path
+from typing import Optional, Iterator, Callable
+
+from git_vote_cog.util import ExecutorPool, wrap_async
+
+# exports are long running, they get their own thread so they never hold up anything else
+EXPORT_POOL = ExecutorPool("export", 1)
+
+HISTORY_FIELDS = ["repo", "issue_id", "author", "channel_id", "message_id", "outcome", "aye_count", "nay_count",
+                  "period_start", "period_end", "complete"]
+
+EXPORT_FORMATS = ["csv", "jsonl"]
+
+
+def iter_history(db_path: Path, since: Optional[int] = None, until: Optional[int] = None,
+                 repo: Optional[str] = None, batch_size: int = 500) -> Iterator[tuple]:
+    """Stream archived votes (ordered by end time) a batch at a time, on its own read-only connection"""
+    clauses, params = [], []
+    if since is not None:
+        clauses.append("period_end >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("period_end < ?")
+        params.append(until)
+    if repo is not None:
+        clauses.append("repo = ?")
+        params.append(repo)
+
+    sql = f"select {', '.join(HISTORY_FIELDS)} from vote_history"
+    if len(clauses) > 0:
+        sql += f" where {' and '.join(clauses)}"
+    sql += " order by period_end, id"
+
+    # WAL mode lets this read alongside the vote db thread's writes
+    con = sqlite3.connect(f"{db_path.as_uri()}?mode=ro", uri=True)
+    try:
+        cursor = con.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if len(rows) == 0:
+                break
+            yield from rows
+    finally:
+        con.close()
+
+
+def export_history(db_path: Path, out_path: Path, fmt: str = "csv", since: Optional[int] = None,
+                   until: Optional[int] = None, repo: Optional[str] = None,
+                   progress: Optional[Callable[[int], None]] = None, progress_every: int = 1000) -> int:
+    """Write archived votes to a gzip compressed csv/jsonl file, row by row. Returns the number of rows written."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'")
+
+    count = 0
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(out_path, "wt", encoding="utf-8", newline="") as f:
+        writer = None
+        if fmt == "csv":
+            writer = csv.writer(f)
+            writer.writerow(HISTORY_FIELDS)
+
+        for row in iter_history(db_path, since, until, repo):
+            if writer is not None:
+                writer.writerow(row)
+            else:
+                f.write(json.dumps(dict(zip(HISTORY_FIELDS, row))))
+                f.write("\n")
+
+            count += 1
+            if progress is not None and count % progress_every == 0:
+                progress(count)
+
+    if progress is not None:
+        progress(count)
+    return count
+
+
+# same as `export_history`, run on the export thread
+export_history_async = wrap_async(EXPORT_POOL)(export_history)
@@ -0,0 +1,299 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Optional, Any, Iterable, Tuple, Dict, List
+from urllib.parse import quote
+
+import aiohttp
+
+from git_vote_cog.util import LOG
+
+API_URL = "https://api.github.com"
+
+# pull request fields fetched by the bulk loader, mapped back onto the REST shape in `_graphql_pull`.
+# body is left out (it can be large), Issue loads it lazily when rendering needs it.
+PULL_FRAGMENT = """
+fragment pull on PullRequest {
+  number title url state merged
+  author { login }
+  labels(first: 100) { nodes { name } }
+}
+"""
+
+# request priorities, lower values are served first when the rate limit budget runs short
+PRIORITY_HIGH = 0  # vote ending label writes
+PRIORITY_NORMAL = 1  # vote starting label writes and refreshes
+PRIORITY_LOW = 2  # lookups
+
+
+class GithubError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Github API error {status}: {message}")
+        self.status = status
+
+
+class ResponseCache:
+    """Bounded LRU of GET responses with their validators (ETag/Last-Modified), used for conditional requests"""
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self.entries: OrderedDict[str, Tuple[Optional[str], Optional[str], Any]] = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(self, url: str) -> Optional[Tuple[Optional[str], Optional[str], Any]]:
+        entry = self.entries.get(url)
+        if entry is not None:
+            self.entries.move_to_end(url)
+        return entry
+
+    def put(self, url: str, etag: Optional[str], last_modified: Optional[str], body: Any):
+        self.entries[url] = (etag, last_modified, body)
+        self.entries.move_to_end(url)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def load(self, path: Path):
+        if not path.exists():
+            return
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                for url, etag, last_modified, body in json.load(f):
+                    self.put(url, etag, last_modified, body)
+        except (OSError, ValueError):
+            LOG.exception(f"Unable to load Github response cache from {path}")
+
+    def save(self, path: Path):
+        entries = [[url, *entry] for url, entry in self.entries.items()]
+        with path.open("w", encoding="utf-8") as f:
+            json.dump(entries, f)
+
+
+class RateLimiter:
+    """Central scheduler for Github requests. Tracks the remaining budget (X-RateLimit-* headers), holds back lower
+    priority requests as it shrinks and pauses everything while a Retry-After/secondary limit is in effect."""
+
+    def __init__(self, reserve: int = 100, max_retries: int = 3):
+        self.reserve = reserve
+        self.max_retries = max_retries
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset_at: float = 0.0
+        self.blocked_until: float = 0.0
+        self.waiting = [0, 0, 0]
+        self.delayed: int = 0
+        self.retried: int = 0
+
+    def _floor(self, priority: int) -> int:
+        # budget held back for requests of a higher priority
+        return self.reserve * priority // PRIORITY_LOW
+
+    def _delay(self, priority: int, core: bool = True) -> float:
+        now = time.time()
+        if self.blocked_until > now:
+            return self.blocked_until - now
+        if core and self.remaining is not None and self.remaining <= self._floor(priority) and self.reset_at > now:
+            return self.reset_at - now
+        if any(self.waiting[p] > 0 for p in range(priority)):
+            return 0.1
+        return 0.0
+
+    async def acquire(self, priority: int, core: bool = True):
+        """Wait for budget for a request. `core` is False for requests billed to another budget (graphql), those only
+        wait out pauses and higher priority requests."""
+        delay = self._delay(priority, core)
+        if delay > 0:
+            self.delayed += 1
+            self.waiting[priority] += 1
+            try:
+                while delay > 0:
+                    LOG.debug(f"Github request (priority={priority}) delayed {delay:.1f}s by rate limit")
+                    await asyncio.sleep(min(delay, 30))
+                    delay = self._delay(priority, core)
+            finally:
+                self.waiting[priority] -= 1
+
+        # count the request against the budget right away, so concurrent requests see it
+        if core and self.remaining is not None:
+            self.remaining = max(0, self.remaining - 1)
+
+    def update(self, headers) -> Optional[float]:
+        """Read rate limit headers from a response. Returns a backoff, in seconds, if the request was limited."""
+        # graphql/search have their own budgets, only the core REST budget is tracked
+        if "X-RateLimit-Remaining" in headers and headers.get("X-RateLimit-Resource", "core") == "core":
+            self.limit = int(headers.get("X-RateLimit-Limit", self.limit or 0))
+            self.remaining = int(headers["X-RateLimit-Remaining"])
+            self.reset_at = float(headers.get("X-RateLimit-Reset", self.reset_at))
+
+        return _parse_retry_after(headers.get("Retry-After"))
+
+    def backoff(self, seconds: float):
+        self.retried += 1
+        self.blocked_until = max(self.blocked_until, time.time() + seconds)
+
+    def __str__(self) -> str:
+        reset_in = max(0, int(self.reset_at - time.time()))
+        blocked_for = max(0, int(self.blocked_until - time.time()))
+        return f"{self.remaining}/{self.limit} (reset in {reset_in}s, blocked for {blocked_for}s)"
+
+
+class GithubClient:
+    """Minimal asyncio Github REST client, covering the calls the cog makes. Connections are pooled and kept alive."""
+
+    def __init__(self, token: str, connections: int = 10, cache: Optional[ResponseCache] = None,
+                 limiter: Optional[RateLimiter] = None):
+        self.token = token
+        self.connections = connections
+        self.cache = cache if cache is not None else ResponseCache(256)
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._closed = False
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # created lazily, it must be bound to the running loop. Once closed the client stays closed, a late caller
+        # would open a session nobody closes.
+        if self._closed:
+            raise RuntimeError("GithubClient is closed")
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.connections, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={
+                    "Authorization": f"token {self.token}",
+                    "Accept": "application/vnd.github+json",
+                    "User-Agent": "git-vote-cog",
+                },
+                timeout=aiohttp.ClientTimeout(total=30),
+            )
+        return self._session
+
+    async def close(self):
+        self._closed = True
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _request(self, method: str, path: str, body: Optional[Any] = None,
+                       priority: int = PRIORITY_LOW) -> Any:
+        url = f"{API_URL}{path}"
+
+        # GETs are conditional on the cached representation, a 304 doesn't count against the rate limit
+        headers = {}
+        cached = self.cache.get(url) if method == "GET" else None
+        if cached is not None:
+            etag, last_modified, _ = cached
+            if etag is not None:
+                headers["If-None-Match"] = etag
+            if last_modified is not None:
+                headers["If-Modified-Since"] = last_modified
+
+        attempt = 0
+        while True:
+            await self.limiter.acquire(priority, core=path != "/graphql")
+            async with self.session.request(method, url, json=body, headers=headers) as resp:
+                LOG.debug(f"{method} {path}: {resp.status}")
+                retry_after = self.limiter.update(resp.headers)
+
+                # rate limited, back off and retry
+                if resp.status in (403, 429) and attempt < self.limiter.max_retries:
+                    if retry_after is None and self.limiter.remaining == 0:
+                        retry_after = self.limiter.reset_at - time.time()
+                    if retry_after is None and "rate limit" in (await resp.text()).lower():
+                        retry_after = 60 * (attempt + 1)
+                    if retry_after is not None:
+                        LOG.warning(f"Github rate limit hit on {method} {path}, retrying in {retry_after:.0f}s")
+                        self.limiter.backoff(max(1.0, retry_after))
+                        attempt += 1
+                        continue
+
+                if resp.status == 304 and cached is not None:
+                    self.cache.hits += 1
+                    return cached[2]
+                if resp.status >= 400:
+                    raise GithubError(resp.status, await resp.text())
+                if resp.status == 204:
+                    return None
+
+                data = await resp.json()
+                if method == "GET":
+                    self.cache.misses += 1
+                    etag = resp.headers.get("ETag")
+                    last_modified = resp.headers.get("Last-Modified")
+                    if etag is not None or last_modified is not None:
+                        self.cache.put(url, etag, last_modified, data)
+                return data
+
+    async def get_pull(self, repo_name: str, pr_id: int, priority: int = PRIORITY_LOW) -> Optional[dict]:
+        try:
+            return await self._request("GET", f"/repos/{repo_name}/pulls/{pr_id}", priority=priority)
+        except GithubError as err:
+            if err.status == 404:
+                return None
+            raise err
+
+    async def graphql(self, query: str, variables: dict, priority: int = PRIORITY_LOW) -> dict:
+        result = await self._request("POST", "/graphql", {"query": query, "variables": variables}, priority)
+        if result.get("data") is None:
+            raise GithubError(200, str(result.get("errors")))
+        return result["data"]
+
+    async def get_pulls(self, repo_name: str, pr_ids: List[int], priority: int = PRIORITY_LOW) \
+            -> Dict[int, Optional[dict]]:
+        """Fetch many pull requests of a repo in one GraphQL query. Missing PRs map to None."""
+        owner, name = repo_name.split('/', 1)
+        fields = " ".join(f"pr{pr_id}: pullRequest(number: {int(pr_id)}) {{ ...pull }}" for pr_id in pr_ids)
+        query = f"query($owner: String!, $name: String!) {{ repository(owner: $owner, name: $name) {{ {fields} }} }}"
+
+        data = await self.graphql(query + PULL_FRAGMENT, {"owner": owner, "name": name}, priority)
+        repo = data.get("repository") or {}
+        return {pr_id: _graphql_pull(repo.get(f"pr{pr_id}")) for pr_id in pr_ids}
+
+    async def add_labels(self, repo_name: str, pr_id: int, labels: Iterable[str],
+                         priority: int = PRIORITY_NORMAL) -> [dict]:
+        return await self._request("POST", f"/repos/{repo_name}/issues/{pr_id}/labels", {"labels": list(labels)},
+                                   priority)
+
+    async def remove_label(self, repo_name: str, pr_id: int, label: str, priority: int = PRIORITY_NORMAL) -> [dict]:
+        return await self._request("DELETE", f"/repos/{repo_name}/issues/{pr_id}/labels/{quote(label, safe='')}",
+                                   priority=priority)
+
+    async def set_labels(self, repo_name: str, pr_id: int, labels: Iterable[str],
+                         priority: int = PRIORITY_NORMAL) -> [dict]:
+        return await self._request("PUT", f"/repos/{repo_name}/issues/{pr_id}/labels", {"labels": list(labels)},
+                                   priority)
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After is either seconds or an HTTP date"""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, AttributeError):
+        LOG.warning(f"Ignoring unparsable Retry-After header '{value}'")
+        return None
+
+
+def _graphql_pull(node: Optional[dict]) -> Optional[dict]:
+    if node is None:
+        return None
+
+    # same keys as the REST pull request payload
+    author = node.get("author") or {"login": "ghost"}
+    return {
+        "number": node["number"],
+        "html_url": node["url"],
+        "title": node["title"],
+        "user": {"login": author["login"]},
+        "labels": node["labels"]["nodes"],
+        "state": "open" if node["state"] == "OPEN" else "closed",
+        "merged": node["merged"],
+    }
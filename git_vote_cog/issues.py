@@ -1,73 +1,84 @@
-from typing import Optional, Set
+import asyncio
+import sys
+from typing import Optional, Set, FrozenSet
 
-import github
-from github.PullRequest import PullRequest
-
-from git_vote_cog.util import wrap_async
+from git_vote_cog.config import Labels
+from git_vote_cog.github_api import GithubClient, PRIORITY_NORMAL, PRIORITY_LOW
 
 
 class Issue:
-    def __init__(self, pr: Optional[PullRequest]):
+    """The fields of a pull request the cog uses. The PR payload itself isn't kept, votes hold issues for their whole
+    voting period."""
+
+    __slots__ = ("client", "repo_name", "id", "url", "title", "description", "author", "labels", "merged", "exists",
+                 "_labels_lock")
+
+    def __init__(self, client: GithubClient, repo_name: str, pr: Optional[dict]):
         # class variables def
-        self._pr: Optional[PullRequest] = None
+        self.client: GithubClient = client
+        self.repo_name: str = sys.intern(repo_name)
         self.id: int = -1
         self.url: str = ""
         self.title: str = ""
-        self.description: str = ""
+        self.description: Optional[str] = ""
         self.author: str = ""
-        self.labels: Set[str] = set()
+        self.labels: FrozenSet[str] = frozenset()
+        self.merged: bool = False
         self.exists: bool = False
+        self._labels_lock: Optional[asyncio.Lock] = None
 
         # init class
-        self.pr = pr
-
-    @wrap_async
-    def remove_label(self, tag: [str]):
-        try:
-            self.pr.remove_from_labels(tag)
-        except github.GithubException as err:
-            if not err.status == 404:
-                raise err
-
-        try:
-            self.labels.remove(tag)
-        except KeyError:
-            pass
-
-    @wrap_async
-    def add_label(self, tag: str):
-        self.pr.add_to_labels(tag)
-        self.labels.add(tag)
-
-    @wrap_async
-    def update(self):
-        if self.pr is None:
+        self._load(pr)
+
+    async def set_labels(self, labels: Set[str], priority: int = PRIORITY_NORMAL):
+        """Replace the PR labels in a single request. Nothing is sent if they already match. Writes are serialized,
+        votes in several channels share the issue and make the same transition."""
+        async with self._lock():
+            await self._put_labels(labels, priority)
+
+    async def transition_labels(self, labels: Labels, state: str, priority: int = PRIORITY_NORMAL):
+        """Swap whichever vote label the PR has for `state` (one of the vote labels in `labels`)"""
+        vote_labels = {labels.needs_vote, labels.vote_in_progress, labels.vote_accepted, labels.vote_rejected}
+        async with self._lock():
+            await self._put_labels((self.labels - vote_labels) | {state}, priority)
+
+    def _lock(self) -> asyncio.Lock:
+        # created on the first label write, resumed votes hold their issue long before that
+        if self._labels_lock is None:
+            self._labels_lock = asyncio.Lock()
+        return self._labels_lock
+
+    async def _put_labels(self, labels: Set[str], priority: int):
+        if labels == self.labels:
+            return
+
+        result = await self.client.set_labels(self.repo_name, self.id, sorted(labels), priority)
+        self.labels = frozenset(sys.intern(label["name"]) for label in result)
+
+    async def update(self, priority: int = PRIORITY_NORMAL):
+        if self.id < 0:
             return
 
-        try:
-            self.pr.update()
-            self.pr = self.pr
-        except github.UnknownObjectException:
-            self.pr = None
+        self._load(await self.client.get_pull(self.repo_name, self.id, priority))
 
-    @property
-    def pr(self) -> Optional[PullRequest]:
-        return self._pr
+    async def load_details(self):
+        """Fetch lazy fields (description) that bulk lookups leave out, only needed when rendering the poll"""
+        if self.description is None and self.id >= 0:
+            await self.update(PRIORITY_LOW)
 
-    @pr.setter
-    def pr(self, pr: Optional[PullRequest]):
-        self._pr = pr
+    def _load(self, pr: Optional[dict]):
         if pr is None:
             self.id = -1
             self.exists = False
         else:
-            self.id = pr.number
-            self.url = pr.html_url
-            self.title = pr.title
-            self.description = pr.body
-            self.author = pr.user.login
-            self.labels = {label.name for label in pr.labels}
-            self.exists = pr.state == "open" and not pr.is_merged()
+            self.id = pr["number"]
+            self.url = pr["html_url"]
+            self.title = pr["title"]
+            self.description = (pr["body"] or "") if "body" in pr else None
+            self.author = sys.intern(pr["user"]["login"])
+            self.labels = frozenset(sys.intern(label["name"]) for label in pr["labels"])
+            self.merged = bool(pr.get("merged") or pr.get("merged_at"))
+            self.exists = pr["state"] == "open" and not self.merged
 
     def __str__(self) -> str:
         return f"PR(id={self.id}, exists={self.exists})"
@@ -1,62 +1,103 @@
-from typing import Optional
+from typing import Optional, Union, NamedTuple
 
-import discord
-from discord import Message
+from discord import Message, PartialMessage
 
+from git_vote_cog.resolver import MessageResolver
+from git_vote_cog.tally import Tally
 
-class PollId:
-    def __init__(self, channel_id: int, msg_id: int):
-        self.channel_id: int = channel_id
-        self.msg_id: int = msg_id
+
+class PollId(NamedTuple):
+    channel_id: int
+    msg_id: int
 
     def __str__(self) -> str:
         return f"[channel={self.channel_id},msg={self.msg_id}]"
 
 
 class Poll:
-    def __init__(self, msg: Optional[Message], aye_emoji: str, nay_emoji: str):
+    """A poll message and its tally. Only a partial handle of the message is kept (enough to edit/pin/reply to it),
+    never the full message with its content, embeds and author."""
+
+    __slots__ = ("_msg", "id", "aye_count", "nay_count", "aye_emoji", "nay_emoji", "exists", "tally_complete",
+                 "seeded")
+
+    def __init__(self, msg: Union[Message, PartialMessage, None], aye_emoji: str, nay_emoji: str):
         # field declarations
-        self._msg: Optional[Message] = None
+        self._msg: Optional[PartialMessage] = None
         self.id: Optional[PollId] = None
         self.aye_count: int = 0
         self.nay_count: int = 0
         self.aye_emoji: str = aye_emoji
         self.nay_emoji: str = nay_emoji
         self.exists: bool = True
+        self.tally_complete: bool = True
+        self.seeded: bool = False  # counts were read off a full message, reaction events only apply after that
 
         # init
         self.msg = msg
 
-    async def update(self):
-        msg = self.msg
-        if msg is None:
+    async def update(self, resolver: MessageResolver, fresh: bool = True):
+        """Re-read the counts off the message. `fresh` skips the resolver's message cache."""
+        if self.msg is None:
             return
 
-        try:
-            self.msg = await msg.channel.fetch_message(msg.id)
-        except discord.errors.NotFound:
-            self.msg = None
+        self.msg = await resolver.fetch(self.id.channel_id, self.id.msg_id, fresh)
+
+    def apply_reaction(self, emoji: str, delta: int) -> bool:
+        """Apply a reaction added (+1)/removed (-1) on the poll message. Returns False if it isn't a vote emoji."""
+        if emoji != self.aye_emoji and emoji != self.nay_emoji:
+            return False
+        if not self.seeded:
+            # only counted if it lands before the seeding fetch reads the message, the live tally is approximate
+            return True
+
+        if emoji == self.aye_emoji:
+            self.aye_count = max(0, self.aye_count + delta)
+        elif emoji == self.nay_emoji:
+            self.nay_count = max(0, self.nay_count + delta)
+        return True
+
+    def clear_reactions(self, emoji: Optional[str] = None):
+        """Reactions were removed in bulk, of one emoji or (None) all of them"""
+        if emoji is None or emoji == self.aye_emoji:
+            self.aye_count = 0
+        if emoji is None or emoji == self.nay_emoji:
+            self.nay_count = 0
+
+    def apply_tally(self, tally: Tally):
+        """Replace the reaction counts with a voter level tally"""
+        self.aye_count = tally.aye_count
+        self.nay_count = tally.nay_count
+        self.tally_complete = tally.complete
 
     def is_vote_accepted(self):
         return self.aye_count > self.nay_count
 
     @property
-    def msg(self) -> Optional[Message]:
+    def msg(self) -> Optional[PartialMessage]:
         return self._msg
 
     @msg.setter
-    def msg(self, msg: Optional[Message]):
-        self._msg = msg
-
+    def msg(self, msg: Union[Message, PartialMessage, None]):
         if msg is None:
             self.exists = False
         else:
             self.id = PollId(msg.channel.id, msg.id)
+
+        # partial messages carry no reactions, counts are seeded lazily
+        if isinstance(msg, Message):
+            self.seeded = True
             for reaction in msg.reactions:
+                # the bot's own reaction is the vote button, not a vote (it may not be added yet)
                 if reaction.emoji == self.aye_emoji:
-                    self.aye_count = reaction.count - 1
+                    self.aye_count = reaction.count - (1 if reaction.me else 0)
                 elif reaction.emoji == self.nay_emoji:
-                    self.nay_count = reaction.count - 1
+                    self.nay_count = reaction.count - (1 if reaction.me else 0)
+
+            # counts are read, drop the rest of the message
+            msg = msg.channel.get_partial_message(msg.id)
+
+        self._msg = msg
 
     def __str__(self) -> str:
         return f"Msg(id={self.id},exists={self.exists})"
@@ -0,0 +1,120 @@
+import asyncio
+import time
+from collections import deque
+from typing import Optional, Callable, Awaitable, Dict, Deque
+
+import discord
+
+from git_vote_cog.util import LOG
+from git_vote_cog.votes import Vote
+
+
+class _ChannelState:
+    def __init__(self):
+        # polls waiting for a refresh, by message id
+        self.dirty: Dict[int, Vote] = {}
+        # times of the latest edits in this channel, the shared budget
+        self.edits: Deque[float] = deque()
+        self.task: Optional[asyncio.Task] = None
+
+
+class PollRefresher:
+    """Keeps poll embeds showing the live tally. Changes are coalesced per message, a message is edited at most once
+    every `refresh_seconds`, and all polls in a channel share a budget of `refresh_channel_edits` edits per
+    `refresh_seconds`. Edits that wouldn't change the rendered embed are skipped."""
+
+    def __init__(self, render: Callable[[Vote], Awaitable[discord.Embed]]):
+        self.render = render
+        self.channels: Dict[int, _ChannelState] = {}
+        self.last_edit: Dict[int, float] = {}
+        self.rendered: Dict[int, dict] = {}
+        self.edits: int = 0
+        self.skipped: int = 0
+
+    def mark(self, vote: Vote):
+        """The poll's tally changed, refresh its embed soon"""
+        poll = vote.poll
+        if poll is None or poll.msg is None:
+            return
+
+        state = self.channels.get(poll.id.channel_id)
+        if state is None:
+            state = self.channels[poll.id.channel_id] = _ChannelState()
+        state.dirty[poll.id.msg_id] = vote
+
+        if state.task is None or state.task.done():
+            state.task = asyncio.create_task(self._drain(state))
+
+    def forget(self, channel_id: int, msg_id: int):
+        """The poll ended or is gone, drop any pending refresh"""
+        state = self.channels.get(channel_id)
+        if state is not None:
+            state.dirty.pop(msg_id, None)
+        self.last_edit.pop(msg_id, None)
+        self.rendered.pop(msg_id, None)
+
+    async def stop(self):
+        tasks = [state.task for state in self.channels.values() if state.task is not None]
+        for task in tasks:
+            task.cancel()
+        if len(tasks) > 0:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.channels.clear()
+        self.last_edit.clear()
+        self.rendered.clear()
+
+    async def _drain(self, state: _ChannelState):
+        while len(state.dirty) > 0:
+            # poll that has gone longest without an edit
+            msg_id = min(state.dirty, key=lambda m: self.last_edit.get(m, 0.0))
+            discord_conf = state.dirty[msg_id].config.discord
+            interval = discord_conf.refresh_seconds
+            budget = discord_conf.refresh_channel_edits
+
+            # wait for the message's own interval, then for the channel's budget
+            now = time.time()
+            delay = self.last_edit.get(msg_id, 0.0) + interval - now
+            while len(state.edits) > 0 and state.edits[0] <= now - interval:
+                state.edits.popleft()
+            if len(state.edits) >= budget:
+                delay = max(delay, state.edits[0] + interval - now)
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            # anything marked from here on is picked up by the next edit
+            vote = state.dirty.pop(msg_id, None)
+            if vote is None or vote.poll is None or vote.poll.msg is None:
+                continue
+            await self._refresh(vote, state)
+
+    async def _refresh(self, vote: Vote, state: _ChannelState):
+        msg_id = vote.poll.id.msg_id
+        try:
+            embed = await self.render(vote)
+        except Exception:
+            LOG.exception(f"Error rendering poll of vote {vote}")
+            return
+
+        # nothing changed since the last edit
+        rendered = embed.to_dict()
+        if self.rendered.get(msg_id) == rendered:
+            self.skipped += 1
+            return
+
+        now = time.time()
+        self.last_edit[msg_id] = now
+        state.edits.append(now)
+        try:
+            await vote.poll.msg.edit(embed=embed)
+            self.rendered[msg_id] = rendered
+            self.edits += 1
+        except discord.errors.NotFound:
+            pass
+        except discord.errors.HTTPException:
+            LOG.exception(f"Error refreshing poll of vote {vote}")
+
+    def __str__(self) -> str:
+        pending = sum(len(state.dirty) for state in self.channels.values())
+        return f"pending={pending}, edits={self.edits}, skipped={self.skipped}"
@@ -0,0 +1,74 @@
+from collections import OrderedDict
+from typing import Optional
+
+import discord
+from discord import Message, PartialMessage
+from redbot.core.bot import Red
+
+from git_vote_cog.util import LOG
+
+
+class MessageResolver:
+    """Looks up poll channels/messages cache first. Channels come from the gateway cache, messages are handed out as
+    partial messages (no request) and only fetched when their content (reactions) is needed. Fetched messages are
+    kept in a small LRU, invalidated on message delete/edit events."""
+
+    def __init__(self, bot: Red, size: int = 128):
+        self.bot = bot
+        self.size = max(1, size)
+        self.messages: OrderedDict[int, Message] = OrderedDict()
+        self.hits: int = 0
+        self.fetches: int = 0
+
+    async def channel(self, channel_id: int) -> Optional[discord.abc.Messageable]:
+        channel = self.bot.get_channel(channel_id)
+        if channel is not None:
+            return channel
+
+        try:
+            self.fetches += 1
+            return await self.bot.fetch_channel(channel_id)
+        except discord.errors.NotFound:
+            return None
+
+    async def partial(self, channel_id: int, msg_id: int) -> Optional[PartialMessage]:
+        """Message handle that can be edited/pinned/replied to without fetching it. It may no longer exist."""
+        channel = await self.channel(channel_id)
+        if channel is None:
+            return None
+        return channel.get_partial_message(msg_id)
+
+    async def fetch(self, channel_id: int, msg_id: int, fresh: bool = False) -> Optional[Message]:
+        """Full message. `fresh` skips the LRU, for reaction counts that must be current. None if it's gone."""
+        msg = self.messages.get(msg_id) if not fresh else None
+        if msg is not None:
+            self.hits += 1
+            self.messages.move_to_end(msg_id)
+            return msg
+
+        channel = await self.channel(channel_id)
+        if channel is None:
+            return None
+
+        try:
+            self.fetches += 1
+            msg = await channel.fetch_message(msg_id)
+        except discord.errors.NotFound:
+            LOG.debug(f"Message {msg_id} in channel {channel_id} no longer exists")
+            self.invalidate(msg_id)
+            return None
+
+        self.messages[msg_id] = msg
+        self.messages.move_to_end(msg_id)
+        while len(self.messages) > self.size:
+            self.messages.popitem(last=False)
+        return msg
+
+    def invalidate(self, msg_id: int):
+        self.messages.pop(msg_id, None)
+
+    def clear(self):
+        self.messages.clear()
+
+    def __str__(self) -> str:
+        return f"entries={len(self.messages)}, hits={self.hits}, fetches={self.fetches}"
@@ -0,0 +1,30 @@
+import time
+from typing import Optional
+
+
+class ResumeProgress:
+    """Progress of resuming persisted votes after a (re)start"""
+
+    def __init__(self):
+        self.started_at: float = time.time()
+        self.ready_at: Optional[float] = None
+        self.loaded: int = 0
+        self.expired: int = 0
+        self.ended: int = 0
+        self.scheduled: int = 0
+        self.hydrated: int = 0
+        self.failed: int = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_at is not None
+
+    @property
+    def time_to_ready(self) -> float:
+        end = self.ready_at if self.ready_at is not None else time.time()
+        return end - self.started_at
+
+    def __str__(self) -> str:
+        state = "ready" if self.ready else "resuming"
+        return f"{state} in {self.time_to_ready:.1f}s (loaded={self.loaded}, expired={self.expired}, " \
+               f"ended={self.ended}, scheduled={self.scheduled}, hydrated={self.hydrated}, failed={self.failed})"
@@ -0,0 +1,131 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Optional, Callable, Awaitable, Dict, Hashable, List, Set
+
+from git_vote_cog.util import LOG
+
+
+class DeadlineScheduler:
+    """Runs callbacks at their deadlines. All deadlines live in one heap, driven by a single task that sleeps until
+    the next one is due, so a pending deadline costs a heap entry instead of a sleeping coroutine.
+
+    Entries are keyed: schedule/cancel/reschedule are O(log n) (cancelled entries are dropped lazily)."""
+
+    def __init__(self):
+        # heap entries are [deadline, seq, key, callback, active]
+        self.heap: List[list] = []
+        self.entries: Dict[Hashable, list] = {}
+        self.running: Set[asyncio.Task] = set()
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._driver: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    @property
+    def next_deadline(self) -> Optional[float]:
+        self._drop_cancelled()
+        return self.heap[0][0] if len(self.heap) > 0 else None
+
+    def start(self):
+        if self._driver is not None:
+            return
+
+        self._wakeup = asyncio.Event()
+        self._driver = asyncio.create_task(self._drive())
+
+    async def stop(self, timeout: float = 30.0):
+        """Stop the driver, pending deadlines are dropped. Callbacks already running get up to `timeout` seconds to
+        finish (one cut off half way may have done work that can't be repeated), the rest is cancelled."""
+        if self._driver is not None:
+            self._driver.cancel()
+            self._driver = None
+
+        self.heap.clear()
+        self.entries.clear()
+
+        if len(self.running) == 0:
+            return
+        _, pending = await asyncio.wait(list(self.running), timeout=timeout)
+        for task in pending:
+            LOG.warning(f"Scheduled callback still running after {timeout}s, cancelling it")
+            task.cancel()
+        if len(pending) > 0:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def schedule(self, key: Hashable, deadline: float, callback: Callable[[], Awaitable[None]]):
+        """Run `callback` at `deadline` (unix time). Replaces anything already scheduled under `key`."""
+        self.cancel(key)
+
+        entry = [deadline, next(self._seq), key, callback, True]
+        self.entries[key] = entry
+        heapq.heappush(self.heap, entry)
+
+        # wake the driver if this is the new earliest deadline
+        if self.heap[0] is entry and self._wakeup is not None:
+            self._wakeup.set()
+
+    def cancel(self, key: Hashable) -> bool:
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return False
+
+        entry[4] = False
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            # mostly cancelled entries, rebuild
+            self.heap = [e for e in self.heap if e[4]]
+            heapq.heapify(self.heap)
+        return True
+
+    def reschedule(self, key: Hashable, deadline: float) -> bool:
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+
+        self.schedule(key, deadline, entry[3])
+        return True
+
+    def _drop_cancelled(self):
+        while len(self.heap) > 0 and not self.heap[0][4]:
+            heapq.heappop(self.heap)
+
+    async def _drive(self):
+        while True:
+            self._drop_cancelled()
+            self._wakeup.clear()
+
+            # sleep until the next deadline, or until an earlier one gets scheduled
+            if len(self.heap) == 0:
+                await self._wakeup.wait()
+                continue
+
+            delay = self.heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            entry = heapq.heappop(self.heap)
+            entry[4] = False
+            del self.entries[entry[2]]
+
+            task = asyncio.create_task(self._run(entry[2], entry[3]))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    @staticmethod
+    async def _run(key: Hashable, callback: Callable[[], Awaitable[None]]):
+        try:
+            await callback()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            LOG.exception(f"Error running scheduled callback {key}")
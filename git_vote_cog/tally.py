@@ -0,0 +1,84 @@
+from typing import Optional, Set
+
+from discord import Message, Reaction
+
+# what to do with users who voted both aye and nay
+DUPLICATE_RULES = ["drop", "aye", "nay", "count_both"]
+
+
+class Tally:
+    """Voter level count of a poll. `complete` is False if counting stopped early, once the outcome was settled."""
+
+    def __init__(self):
+        self.aye_count: int = 0
+        self.nay_count: int = 0
+        self.complete: bool = True
+        self.scanned: int = 0
+
+    def is_vote_accepted(self) -> bool:
+        return self.aye_count > self.nay_count
+
+    def __str__(self) -> str:
+        return f"Tally(aye={self.aye_count},nay={self.nay_count},complete={self.complete},scanned={self.scanned})"
+
+
+def _find_reaction(msg: Message, emoji: str) -> Optional[Reaction]:
+    for reaction in msg.reactions:
+        if str(reaction.emoji) == emoji:
+            return reaction
+    return None
+
+
+async def count_voters(msg: Message, aye_emoji: str, nay_emoji: str, rule: str = "drop") -> Tally:
+    """Count the users who voted on a poll message, excluding bots. Reactors are streamed a page at a time; only aye
+    voter ids are held (to find users who voted both ways, handled by `rule`). Nay voters are counted until the
+    remaining reactions can no longer change the outcome."""
+    if rule not in DUPLICATE_RULES:
+        raise ValueError(f"Unknown duplicate vote rule '{rule}'")
+
+    tally = Tally()
+    ayes: Set[int] = set()
+
+    aye_reaction = _find_reaction(msg, aye_emoji)
+    if aye_reaction is not None:
+        async for user in aye_reaction.users():
+            tally.scanned += 1
+            if not user.bot:
+                ayes.add(user.id)
+    tally.aye_count = len(ayes)
+
+    nay_reaction = _find_reaction(msg, nay_emoji)
+    if nay_reaction is None:
+        return tally
+
+    # each remaining nay reaction moves (nay - aye) by at most this much. The bot's own reaction isn't a vote.
+    swing = 2 if rule == "nay" else 1
+    remaining = nay_reaction.count - (1 if nay_reaction.me else 0)
+    if tally.aye_count > remaining * swing:
+        tally.complete = remaining == 0
+        return tally
+
+    async for user in nay_reaction.users():
+        tally.scanned += 1
+        if user.bot:
+            continue
+
+        remaining -= 1
+        if user.id not in ayes:
+            tally.nay_count += 1
+        elif rule == "drop":
+            tally.aye_count -= 1
+        elif rule == "nay":
+            tally.aye_count -= 1
+            tally.nay_count += 1
+        elif rule == "count_both":
+            tally.nay_count += 1
+
+        # outcome settled: rejected (once a nay voter was seen) can't turn around, accepted holds even if every
+        # remaining reaction swings
+        if remaining > 0 and ((tally.nay_count > 0 and tally.aye_count <= tally.nay_count) or
+                              tally.aye_count - tally.nay_count > remaining * swing):
+            tally.complete = False
+            break
+
+    return tally
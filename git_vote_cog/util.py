@@ -1,7 +1,11 @@
 import asyncio
 import datetime
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps, partial
+from typing import Optional
 
 LOG = logging.getLogger("git-vote-cog")
 LOG.setLevel(logging.INFO)
@@ -9,13 +13,67 @@ if len(LOG.handlers) == 0:
     LOG.addHandler(logging.StreamHandler())
 
 
-def wrap_async(func):
-    @wraps(func)
-    async def run(*args, **kwargs):
-        pf = partial(func, *args, **kwargs)
-        return await asyncio.get_running_loop().run_in_executor(None, pf)
+class ExecutorPool:
+    """Named, separately sized thread pool that tracks how long calls wait before they run"""
 
-    return run
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+        # stats
+        self.calls: int = 0
+        self.in_flight: int = 0
+        self.wait_total: float = 0.0
+        self.wait_max: float = 0.0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix=f"git-vote-cog-{self.name}")
+        return self._executor
+
+    @property
+    def wait_avg(self) -> float:
+        return self.wait_total / self.calls if self.calls > 0 else 0.0
+
+    async def run(self, func, *args, **kwargs):
+        submitted = time.perf_counter()
+
+        def timed():
+            waited = time.perf_counter() - submitted
+            with self._lock:
+                self.calls += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+            return func(*args, **kwargs)
+
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, timed)
+        finally:
+            self.in_flight -= 1
+
+    def __str__(self) -> str:
+        return f"{self.name}(workers={self.max_workers},in_flight={self.in_flight},calls={self.calls}," \
+               f"wait_avg={self.wait_avg * 1000:.1f}ms,wait_max={self.wait_max * 1000:.1f}ms)"
+
+
+# short blocking jobs that must stay off the event loop: large payload decodes, cache files, thread joins
+BLOCKING_POOL = ExecutorPool("blocking", 2)
+
+
+def wrap_async(pool: ExecutorPool):
+    def decorator(func):
+        @wraps(func)
+        async def run(*args, **kwargs):
+            return await pool.run(partial(func, *args, **kwargs))
+
+        return run
+
+    return decorator
 
 
 def pretty_print_timedelta(delta: datetime.timedelta) -> str:
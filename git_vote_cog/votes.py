@@ -3,17 +3,23 @@ import time
 from .config import *
 from .issues import *
 from .polls import *
+from .resolver import *
 from .util import *
 
 
 class Vote:
-    _issue: Optional[Issue] = None
-    _issue_id: int = -1
-    _poll: Optional[Poll] = None
-    _poll_id: Optional[PollId] = None
-    period_start: int = 0
-    period_end: int = 0
-    config: ChannelConfig
+    """A running vote. `config` is a frozen snapshot shared with every other vote of the same channel config."""
+
+    __slots__ = ("_issue", "_issue_id", "_poll", "_poll_id", "period_start", "period_end", "config")
+
+    def __init__(self):
+        self._issue: Optional[Issue] = None
+        self._issue_id: int = -1
+        self._poll: Optional[Poll] = None
+        self._poll_id: Optional[PollId] = None
+        self.period_start: int = 0
+        self.period_end: int = 0
+        self.config: Optional[ChannelConfig] = None
 
     def remaining_seconds(self) -> int:
         seconds = self.period_end - int(time.time())
@@ -22,12 +28,14 @@ class Vote:
 
         return seconds
 
-    async def update(self):
+    async def update(self, resolver: Optional[MessageResolver] = None, refresh_issue: bool = True):
+        """Refresh issue data, unless `refresh_issue` is False. The poll tally is kept live from reaction events, it's
+        only re-read through `resolver` if one is given."""
         actions = []
-        if self.issue is not None:
+        if self.issue is not None and refresh_issue:
             actions.append(self.issue.update())
-        if self.poll is not None:
-            actions.append(self.poll.update())
+        if self.poll is not None and resolver is not None:
+            actions.append(self.poll.update(resolver))
 
         if len(actions) > 0:
             await asyncio.gather(*actions)
@@ -1,10 +1,15 @@
+import asyncio
 import hmac
-from typing import Optional, Callable, Awaitable
+import json
+import time
+from collections import OrderedDict
+from typing import Optional, Callable, Awaitable, List
 
 from aiohttp import web
 
 from git_vote_cog.config import WebhookConfig
-from git_vote_cog.util import LOG
+from git_vote_cog.db import VoteDB
+from git_vote_cog.util import LOG, BLOCKING_POOL
 
 
 class HttpServer:
@@ -13,8 +18,8 @@ class HttpServer:
     site: Optional[web.TCPSite]
     running: bool
 
-    def __init__(self):
-        self.app = web.Application()
+    def __init__(self, max_body_bytes: int = 1024 ** 2):
+        self.app = web.Application(client_max_size=max_body_bytes)
         self.running = False
 
     @property
@@ -51,40 +56,164 @@ class LabelEvent:
         self.label_name = label
         self.label_added = added
 
+    def __str__(self) -> str:
+        return f"LabelEvent({self.repo_name}#{self.pr_id},{'+' if self.label_added else '-'}{self.label_name})"
+
+
+class DeliveryCache:
+    """Bounded TTL/LRU set of seen X-GitHub-Delivery ids, optionally backed by the VoteDB"""
+
+    def __init__(self, size: int, ttl_seconds: int, store: Optional[VoteDB] = None):
+        self.size = max(1, size)
+        self.ttl_seconds = ttl_seconds
+        self.store = store
+        self.entries: OrderedDict[str, float] = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    async def seen(self, delivery_id: str) -> bool:
+        now = time.time()
+        received = self.entries.get(delivery_id)
+        if received is not None and received >= now - self.ttl_seconds:
+            self.entries.move_to_end(delivery_id)
+            self.hits += 1
+            return True
+
+        # fall back to deliveries seen before a restart
+        if self.store is not None and await self.store.has_delivery(delivery_id, int(now - self.ttl_seconds)):
+            self._remember(delivery_id, now)
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        return False
+
+    async def add(self, delivery_id: str):
+        now = time.time()
+        self._remember(delivery_id, now)
+        if self.store is not None:
+            await self.store.add_delivery(delivery_id, int(now), int(now - self.ttl_seconds))
+
+    def _remember(self, delivery_id: str, received: float):
+        self.entries[delivery_id] = received
+        self.entries.move_to_end(delivery_id)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
 
 class Webhook:
-    def __init__(self, config: WebhookConfig, callback: Callable[[LabelEvent], Awaitable[None]]):
+    def __init__(self, config: WebhookConfig, callback: Callable[[LabelEvent], Awaitable[None]],
+                 store: Optional[VoteDB] = None):
         self.http: Optional[HttpServer] = None
         self.config = config
         self.callback = callback
         self.secret = self.config.secret.encode('UTF-8')
+        self.deliveries = DeliveryCache(config.dedup_size, config.dedup_ttl_seconds, store)
+
+        # work queue, drained by the worker tasks
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        self.dropped: int = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return 0 if self.queue is None else self.queue.qsize()
 
     async def _verify_event(self, request: web.Request):
-        header_signature = request.headers.get('X-Hub-Signature')
+        # only pull_request events are of interest, skip everything else before touching the body
+        event_type = request.headers.get('X-GitHub-Event')
+        if event_type != 'pull_request':
+            return web.Response(status=200 if event_type == 'ping' else 204)
+
+        header_signature = request.headers.get('X-Hub-Signature-256') or request.headers.get('X-Hub-Signature')
         if header_signature is None:
             return web.Response(status=403)
 
-        sha_name, signature = header_signature.split('=')
-        body = await request.read()
+        sha_name, _, signature = header_signature.partition('=')
+        if sha_name not in ('sha256', 'sha1'):
+            return web.Response(status=403)
+
+        # drop redeliveries before doing any work on the body
+        delivery_id = request.headers.get('X-GitHub-Delivery')
+        if delivery_id is not None and await self.deliveries.seen(delivery_id):
+            LOG.debug(f"Ignoring duplicate webhook delivery {delivery_id}")
+            return web.Response(status=200)
+
+        # read body (once), bounded by max_body_bytes
+        max_body_bytes = self.config.max_body_bytes
+        if request.content_length is not None and request.content_length > max_body_bytes:
+            return web.Response(status=413)
+        try:
+            body = await request.read()
+        except web.HTTPRequestEntityTooLarge:
+            return web.Response(status=413)
+
         mac = hmac.new(self.secret, msg=body, digestmod=sha_name)
-        if not hmac.compare_digest(str(mac.hexdigest()), str(signature)):
+        if not hmac.compare_digest(mac.hexdigest(), signature):
             LOG.error("Invalid webhook event payload signature!")
             return web.Response(status=403)
 
-        await self._handle_event(await request.json())
+        # decode the bytes already read, large payloads are decoded off the event loop
+        try:
+            if len(body) > self.config.offload_bytes:
+                payload = await BLOCKING_POOL.run(json.loads, body)
+            else:
+                payload = json.loads(body)
+        except ValueError:
+            LOG.error("Invalid webhook event payload!")
+            return web.Response(status=400)
+
+        # only accepted deliveries are recorded, so github's redelivery of a rejected one isn't taken for a duplicate
+        response = await self._handle_event(payload)
+        if delivery_id is not None and response.status == 202:
+            await self.deliveries.add(delivery_id)
+        return response
 
     async def _handle_event(self, body: dict):
-        if body["action"] == 'labeled' or body["action"] == "unlabeled":
+        if body.get("action") in ("labeled", "unlabeled"):
             pr_id = int(body["pull_request"]["number"])
             label = body["label"]["name"]
             repo_name = body["repository"]["full_name"]
             added = body["action"] != 'unlabeled'
 
             event = LabelEvent(repo_name, pr_id, label, added)
-            await self.callback(event)
+            if not self._enqueue(event):
+                return web.Response(status=503)
+
+        # acknowledge right away, the workers do the rest
+        return web.Response(status=202)
+
+    def _enqueue(self, event: LabelEvent) -> bool:
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        # queue is full, apply overflow policy
+        self.dropped += 1
+        if self.config.overflow == "drop_newest":
+            LOG.warning(f"Webhook queue full, dropping {event}")
+            return False
+
+        dropped = self.queue.get_nowait()
+        self.queue.task_done()
+        self.queue.put_nowait(event)
+        LOG.warning(f"Webhook queue full, dropping {dropped}")
+        return True
+
+    async def _work(self):
+        while True:
+            event = await self.queue.get()
+            try:
+                await self.callback(event)
+            except Exception:
+                LOG.exception(f"Error handling webhook event {event}")
+            finally:
+                self.queue.task_done()
 
     def _setup_http(self):
-        http = HttpServer()
+        http = HttpServer(max_body_bytes=self.config.max_body_bytes)
         self.http = http
 
         async def say_hello(request: web.Request):
@@ -105,12 +234,28 @@ class Webhook:
 
         LOG.info(
             f"Starting webhook on http://{self.config.host if self.config.host is not None else 'localhost'}:{self.config.port}{self.config.path}")
+        self.queue = asyncio.Queue(maxsize=self.config.queue_size)
+        self.workers = [asyncio.create_task(self._work()) for _ in range(self.config.workers)]
+
         self._setup_http()
         await self.http.start(host=self.config.host, port=self.config.port)
 
-    async def stop(self):
+    async def stop(self, timeout: float = 30.0):
+        """Stop taking events, then give the workers up to `timeout` seconds to work off the queue. Queued events
+        were already acknowledged (and their deliveries recorded), github won't send them again."""
         if not self.running:
             return
 
         LOG.info("Stopping webhook")
         await self.http.stop()
+
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            LOG.warning(f"Webhook queue not drained after {timeout}s, dropping {self.queue.qsize()} events")
+
+        for worker in self.workers:
+            worker.cancel()
+        if len(self.workers) > 0:
+            await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
@@ -0,0 +1,52 @@
+import unittest
+
+from git_vote_cog.channels import ChannelConfigCache
+from git_vote_cog.config import ChannelConfig
+
+
+def channel_config(channel_id: int, repo_name: str) -> ChannelConfig:
+    conf = ChannelConfig()
+    conf.discord.channel_id = channel_id
+    conf.github.repo_name = repo_name
+    return conf
+
+
+class ForRepoTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = ChannelConfigCache()
+        self.cache.put(1, channel_config(1, "org/repo"))
+        self.cache.put(2, channel_config(2, "Org/Repo"))
+        self.cache.put(3, channel_config(3, "org/*"))
+        self.cache.put(4, channel_config(4, "org/repo-?"))
+        self.cache.put(5, channel_config(5, "other/repo"))
+
+    def channels(self, repo_name: str):
+        return sorted(conf.discord.channel_id for conf in self.cache.for_repo(repo_name))
+
+    def test_exact_and_pattern(self):
+        self.assertEqual(self.channels("org/repo"), [1, 2, 3])
+        self.assertEqual(self.channels("org/repo-2"), [3, 4])
+        self.assertEqual(self.channels("other/repo"), [5])
+        self.assertEqual(self.channels("nobody/repo"), [])
+
+    def test_case_insensitive(self):
+        self.assertEqual(self.channels("ORG/REPO-X"), [3, 4])
+
+    def test_pattern_doesnt_cross_owner(self):
+        self.assertEqual(self.channels("organisation/repo"), [])
+
+    def test_changes_invalidate_matches(self):
+        self.assertEqual(self.channels("org/repo"), [1, 2, 3])
+
+        self.cache.put(3, channel_config(3, "other/*"))
+        self.cache.remove(2)
+        self.assertEqual(self.channels("org/repo"), [1])
+        self.assertEqual(self.channels("other/repo"), [3, 5])
+
+    def test_resolve_names_repo(self):
+        pattern_conf = self.cache.get(3)
+        resolved = self.cache.resolve(pattern_conf, "org/thing")
+        self.assertEqual(resolved.github.repo_name, "org/thing")
+        self.assertEqual(pattern_conf.github.repo_name, "org/*")
+        self.assertIs(self.cache.resolve(pattern_conf, "org/thing"), resolved)
+        self.assertIs(self.cache.resolve(self.cache.get(1), "org/repo"), self.cache.get(1))
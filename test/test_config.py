@@ -0,0 +1,79 @@
+import unittest
+
+from git_vote_cog.config import Field, ChannelConfig, GlobalConfig
+
+
+def field(type, default=None, **kwargs) -> Field:
+    f = Field(type, default, **kwargs)
+    f.name = "value"
+    return f
+
+
+class FieldCoerceTest(unittest.TestCase):
+    def test_bool(self):
+        f = field(bool, False)
+        for value in ("true", "On", " yes ", "1", True):
+            self.assertIs(f.coerce(value), True, value)
+        for value in ("false", "OFF", "no", "0", "", False):
+            self.assertIs(f.coerce(value), False, value)
+        with self.assertRaises(ValueError):
+            f.coerce("maybe")
+
+    def test_int(self):
+        f = field(int, 0)
+        self.assertEqual(f.coerce("42"), 42)
+        self.assertEqual(f.coerce(3.0), 3)
+        for value in ("abc", 0.2, [1]):
+            with self.assertRaises(ValueError):
+                f.coerce(value)
+
+    def test_minimum(self):
+        f = field(int, 1, minimum=1)
+        self.assertEqual(f.coerce(1), 1)
+        with self.assertRaises(ValueError):
+            f.coerce("0")
+
+    def test_choices(self):
+        f = field(str, "a", choices=("a", "b"))
+        self.assertEqual(f.coerce("b"), "b")
+        with self.assertRaises(ValueError):
+            f.coerce("c")
+
+    def test_nullable(self):
+        f = field(str)
+        self.assertIsNone(f.coerce(None))
+        self.assertIsNone(f.coerce("None"))
+        self.assertIsNone(f.coerce(""))
+        self.assertEqual(f.coerce("org/repo"), "org/repo")
+
+        with self.assertRaises(ValueError):
+            field(int, 5).coerce(None)
+
+    def test_section(self):
+        f = GlobalConfig.field("github.webhook.port")
+        self.assertEqual(f.coerce("8080"), 8080)
+        with self.assertRaises(ValueError):
+            ChannelConfig._field_map["discord"].coerce("text")
+
+
+class ConfigTest(unittest.TestCase):
+    def test_set_coerces(self):
+        conf = ChannelConfig()
+        conf.set("discord.voting_period_seconds", "60")
+        self.assertEqual(conf.discord.voting_period_seconds, 60)
+        with self.assertRaises(ValueError):
+            conf.set("discord.duplicate_votes", "bogus")
+
+    def test_frozen(self):
+        conf = ChannelConfig().freeze()
+        with self.assertRaises(AttributeError):
+            conf.discord.voting_period_seconds = 60
+
+        copy = conf.copy()
+        copy.discord.voting_period_seconds = 60
+        self.assertEqual(conf.discord.voting_period_seconds, 10)
+
+    def test_from_dict_skips_invalid(self):
+        conf = ChannelConfig().from_dict({"discord": {"voting_period_seconds": "abc", "count_voters": "yes"}})
+        self.assertEqual(conf.discord.voting_period_seconds, 10)
+        self.assertIs(conf.discord.count_voters, True)
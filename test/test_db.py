@@ -0,0 +1,152 @@
+import hashlib
+import json
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+import discord
+
+from git_vote_cog.config import ChannelConfig
+from git_vote_cog.db import VoteDB, MIGRATIONS
+from git_vote_cog.issues import Issue
+from git_vote_cog.polls import Poll
+from git_vote_cog.votes import Vote
+from test.test_github import rest_pull
+
+
+def finished_vote(msg_id: int, aye_count: int, nay_count: int, complete: bool = True, pr_id: int = None,
+                  period_end: int = 2000) -> Vote:
+    config = ChannelConfig()
+    config.github.repo_name = "org/repo"
+    config.discord.channel_id = 10
+
+    channel = discord.PartialMessageable(state=None, id=10, type=discord.ChannelType.text)
+    vote = Vote()
+    vote.issue = Issue(None, "org/repo", rest_pull(msg_id if pr_id is None else pr_id))
+    vote.poll = Poll(channel.get_partial_message(msg_id), "+", "-")
+    vote.poll.aye_count = aye_count
+    vote.poll.nay_count = nay_count
+    vote.poll.tally_complete = complete
+    vote.period_start = 1000
+    vote.period_end = period_end
+    vote.config = config.freeze()
+    return vote
+
+
+class MigrationTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    async def asyncTearDown(self):
+        self.tmp.cleanup()
+
+    def user_version(self) -> int:
+        con = sqlite3.connect(str(self.dir / 'votes.db'))
+        try:
+            return con.execute("pragma user_version").fetchone()[0]
+        finally:
+            con.close()
+
+    async def test_new_db(self):
+        db = VoteDB(self.dir)
+        await db.init()
+        await db.close()
+        self.assertEqual(self.user_version(), len(MIGRATIONS))
+
+    async def test_upgrade_from_version_1(self):
+        config = ChannelConfig()
+        config.github.repo_name = "org/repo"
+        config.discord.channel_id = 10
+
+        # a db as written by the first schema version
+        con = sqlite3.connect(str(self.dir / 'votes.db'))
+        MIGRATIONS[0](con)
+        con.execute("pragma user_version = 1")
+        con.execute("insert into vote values (?, ?, ?, ?, ?, ?)", [7, 10, 100, 1000, 2000, json.dumps(config.to_dict())])
+        con.commit()
+        con.close()
+
+        db = VoteDB(self.dir)
+        await db.init()
+        try:
+            votes = await db.list()
+        finally:
+            await db.close()
+
+        self.assertEqual(self.user_version(), len(MIGRATIONS))
+        self.assertEqual(len(votes), 1)
+        vote = votes[0]
+        self.assertEqual((vote._issue_id, vote._poll_id.channel_id, vote._poll_id.msg_id), (7, 10, 100))
+        self.assertEqual((vote.period_start, vote.period_end), (1000, 2000))
+        self.assertEqual(vote.config.github.repo_name, "org/repo")
+
+    async def test_stored_config_copied_as_is(self):
+        # written by an older config class: an unknown field, keys unsorted
+        config_json = json.dumps({"github": {"repo_name": "org/repo", "retired": 1}, "discord": {"channel_id": 10}})
+
+        con = sqlite3.connect(str(self.dir / 'votes.db'))
+        MIGRATIONS[0](con)
+        con.execute("insert into vote values (?, ?, ?, ?, ?, ?)", [7, 10, 100, 1000, 2000, config_json])
+        MIGRATIONS[1](con)
+        row = con.execute("select vote.repo, config.hash, config.config_json from vote join config "
+                          "on vote.config_hash = config.hash").fetchone()
+        con.close()
+
+        self.assertEqual(row, ("org/repo", hashlib.sha256(config_json.encode('UTF-8')).hexdigest(), config_json))
+
+    async def test_migrated_db_is_left_alone(self):
+        db = VoteDB(self.dir)
+        await db.init()
+        await db.close()
+
+        db = VoteDB(self.dir)
+        await db.init()
+        await db.close()
+        self.assertEqual(self.user_version(), len(MIGRATIONS))
+
+
+class ArchiveTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = VoteDB(Path(self.tmp.name))
+        await self.db.init()
+
+    async def asyncTearDown(self):
+        await self.db.close()
+        self.tmp.cleanup()
+
+    async def test_archive_moves_vote(self):
+        vote = finished_vote(1, 3, 1)
+        await self.db.persist(vote)
+        self.assertEqual(await self.db.count(), 1)
+
+        await self.db.archive(vote)
+        self.assertEqual(await self.db.count(), 0)
+
+        stats = await self.db.stats("repo", "org/repo")
+        self.assertEqual((stats.votes, stats.accepted, stats.turnout, stats.counted), (1, 1, 4, 1))
+        self.assertEqual(stats.median_turnout, 4)
+        self.assertEqual((await self.db.stats("author", "author")).votes, 1)
+
+    async def test_incomplete_tally_left_out_of_turnout(self):
+        for msg_id, turnout in enumerate([2, 4, 6]):
+            await self.db.archive(finished_vote(msg_id, turnout, 0))
+        await self.db.archive(finished_vote(3, 0, 1, complete=False))
+
+        stats = await self.db.stats("repo", "org/repo")
+        self.assertEqual((stats.votes, stats.accepted, stats.turnout, stats.counted), (4, 3, 12, 3))
+        self.assertEqual(stats.median_turnout, 4)
+
+    async def test_ends_last(self):
+        # the same PR voted on in three channels, plus another PR
+        votes = [finished_vote(1, 0, 0, pr_id=7, period_end=3000), finished_vote(2, 0, 0, pr_id=7, period_end=2000),
+                 finished_vote(3, 0, 0, pr_id=7, period_end=3000), finished_vote(4, 0, 0, pr_id=8, period_end=4000)]
+        for vote in votes:
+            await self.db.persist(vote)
+
+        self.assertEqual([await self.db.ends_last(vote) for vote in votes], [False, False, True, True])
+
+        await self.db.archive(votes[2])
+        self.assertTrue(await self.db.ends_last(votes[0]))
@@ -0,0 +1,69 @@
+import csv
+import gzip
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from git_vote_cog.db import VoteDB
+from git_vote_cog.export import export_history, export_history_async, HISTORY_FIELDS
+from test.test_db import finished_vote
+
+
+class ExportTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        db = VoteDB(self.dir)
+        await db.init()
+        try:
+            for msg_id, period_end in enumerate([3000, 1000, 2000]):
+                vote = finished_vote(msg_id, 2, 1)
+                vote.period_end = period_end
+                await db.archive(vote)
+        finally:
+            await db.close()
+
+        self.db_path = self.dir / "votes.db"
+
+    async def asyncTearDown(self):
+        self.tmp.cleanup()
+
+    def read(self, path: Path) -> str:
+        with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+            return f.read()
+
+    def test_csv(self):
+        out_path = self.dir / "out" / "history.csv.gz"
+        self.assertEqual(export_history(self.db_path, out_path), 3)
+
+        rows = list(csv.reader(self.read(out_path).splitlines()))
+        self.assertEqual(rows[0], HISTORY_FIELDS)
+        # ordered by end time
+        self.assertEqual([row[HISTORY_FIELDS.index("period_end")] for row in rows[1:]], ["1000", "2000", "3000"])
+
+    def test_jsonl(self):
+        out_path = self.dir / "history.jsonl.gz"
+        self.assertEqual(export_history(self.db_path, out_path, "jsonl"), 3)
+
+        rows = [json.loads(line) for line in self.read(out_path).splitlines()]
+        self.assertEqual([row["message_id"] for row in rows], [1, 2, 0])
+        self.assertEqual((rows[0]["repo"], rows[0]["aye_count"], rows[0]["nay_count"]), ("org/repo", 2, 1))
+
+    def test_filters(self):
+        out_path = self.dir / "history.jsonl.gz"
+        self.assertEqual(export_history(self.db_path, out_path, "jsonl", since=2000), 2)
+        self.assertEqual(export_history(self.db_path, out_path, "jsonl", since=1000, until=3000), 2)
+        self.assertEqual(export_history(self.db_path, out_path, "jsonl", repo="org/other"), 0)
+        self.assertEqual(self.read(out_path), "")
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            export_history(self.db_path, self.dir / "history.xml.gz", "xml")
+
+    async def test_progress_off_loop(self):
+        reported = []
+        count = await export_history_async(self.db_path, self.dir / "history.csv.gz", progress=reported.append,
+                                           progress_every=2)
+        self.assertEqual(count, 3)
+        self.assertEqual(reported, [2, 3])
@@ -0,0 +1,106 @@
+import asyncio
+import unittest
+from typing import Optional, Any
+
+from git_vote_cog.api import VoteAPI
+from git_vote_cog.config import GlobalConfig, Labels
+from git_vote_cog.github_api import GithubClient, PRIORITY_LOW
+from git_vote_cog.votes import Vote
+
+
+def rest_pull(pr_id: int, labels=()) -> dict:
+    return {
+        "number": pr_id,
+        "html_url": f"https://github.com/org/repo/pull/{pr_id}",
+        "title": f"PR {pr_id}",
+        "body": "description",
+        "user": {"login": "author"},
+        "labels": [{"name": label} for label in labels],
+        "state": "open",
+        "merged": False,
+    }
+
+
+class CountingClient(GithubClient):
+    """Answers requests from memory, recording each one"""
+
+    def __init__(self, labels=()):
+        super().__init__("token")
+        self.labels = list(labels)
+        self.requests = []
+
+    async def _request(self, method: str, path: str, body: Optional[Any] = None,
+                       priority: int = PRIORITY_LOW) -> Any:
+        self.requests.append((method, path))
+        await asyncio.sleep(0)
+        if method == "PUT":
+            self.labels = list(body["labels"])
+            return [{"name": label} for label in self.labels]
+        return rest_pull(int(path.rsplit("/", 1)[1]), self.labels)
+
+
+class RequestCountTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.client = CountingClient(["needs_vote"])
+        self.api = VoteAPI(GlobalConfig(), None)
+        self.api.client = self.client
+
+    async def test_get_issue_single_request(self):
+        issue = await self.api.get_issue("org/repo", 7)
+
+        self.assertEqual(self.client.requests, [("GET", "/repos/org/repo/pulls/7")])
+        self.assertEqual(issue.id, 7)
+        self.assertEqual(issue.labels, {"needs_vote"})
+
+    async def test_update_single_request(self):
+        issue = await self.api.get_issue("org/repo", 7)
+        self.client.requests.clear()
+
+        await issue.update()
+        self.assertEqual(self.client.requests, [("GET", "/repos/org/repo/pulls/7")])
+
+    async def test_bulk_loaded_issue_not_refreshed(self):
+        vote = Vote()
+        vote.issue = await self.api.get_issue("org/repo", 7)
+        vote.poll = None
+        self.client.requests.clear()
+
+        await vote.update(refresh_issue=False)
+        self.assertEqual(self.client.requests, [])
+
+        await vote.update()
+        self.assertEqual(self.client.requests, [("GET", "/repos/org/repo/pulls/7")])
+
+    async def test_transition_labels_single_request(self):
+        issue = await self.api.get_issue("org/repo", 7)
+        self.client.requests.clear()
+
+        labels = Labels()
+        await issue.transition_labels(labels, labels.vote_in_progress)
+        self.assertEqual(self.client.requests, [("PUT", "/repos/org/repo/issues/7/labels")])
+        self.assertEqual(issue.labels, {"vote_in_progress"})
+
+        # already there, nothing to send
+        await issue.transition_labels(labels, labels.vote_in_progress)
+        self.assertEqual(len(self.client.requests), 1)
+
+    async def test_shared_issue_transitions_once(self):
+        # votes in several channels share the issue and all swap in the same label
+        issue = await self.api.get_issue("org/repo", 7)
+        self.client.requests.clear()
+
+        labels = Labels()
+        await asyncio.gather(*[issue.transition_labels(labels, labels.vote_in_progress) for _ in range(4)])
+        self.assertEqual(self.client.requests, [("PUT", "/repos/org/repo/issues/7/labels")])
+
+
+class ClientCloseTest(unittest.IsolatedAsyncioTestCase):
+    async def test_closed_client_stays_closed(self):
+        client = GithubClient("token")
+        session = client.session
+        self.assertIs(client.session, session)
+
+        await client.close()
+        self.assertTrue(session.closed)
+        with self.assertRaises(RuntimeError):
+            client.session
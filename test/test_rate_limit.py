@@ -0,0 +1,70 @@
+import time
+import unittest
+from email.utils import formatdate
+
+from git_vote_cog.github_api import RateLimiter, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+
+
+def rate_headers(remaining: int, reset_in: float = 60, resource: str = "core") -> dict:
+    return {
+        "X-RateLimit-Limit": "5000",
+        "X-RateLimit-Remaining": str(remaining),
+        "X-RateLimit-Reset": str(int(time.time() + reset_in)),
+        "X-RateLimit-Resource": resource,
+    }
+
+
+class RateLimiterTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.limiter = RateLimiter(reserve=100)
+
+    def test_budget_held_back_by_priority(self):
+        self.limiter.update(rate_headers(60))
+        self.assertEqual(self.limiter._delay(PRIORITY_HIGH), 0)
+        self.assertEqual(self.limiter._delay(PRIORITY_NORMAL), 0)
+        self.assertGreater(self.limiter._delay(PRIORITY_LOW), 0)
+
+        self.limiter.update(rate_headers(0))
+        self.assertGreater(self.limiter._delay(PRIORITY_HIGH), 0)
+
+    def test_waiting_higher_priority_goes_first(self):
+        self.limiter.waiting[PRIORITY_HIGH] = 1
+        self.assertEqual(self.limiter._delay(PRIORITY_HIGH), 0)
+        self.assertGreater(self.limiter._delay(PRIORITY_LOW), 0)
+
+    def test_other_budgets_ignored(self):
+        self.limiter.update(rate_headers(4000))
+        self.limiter.update(rate_headers(10, resource="graphql"))
+        self.assertEqual(self.limiter.remaining, 4000)
+
+    async def test_graphql_not_counted_against_core(self):
+        self.limiter.update(rate_headers(500))
+        await self.limiter.acquire(PRIORITY_LOW)
+        self.assertEqual(self.limiter.remaining, 499)
+
+        await self.limiter.acquire(PRIORITY_LOW, core=False)
+        self.assertEqual(self.limiter.remaining, 499)
+
+        # nor held back by it
+        self.limiter.update(rate_headers(0))
+        self.assertEqual(self.limiter._delay(PRIORITY_LOW, core=False), 0)
+
+    def test_retry_after_seconds(self):
+        self.assertEqual(self.limiter.update({"Retry-After": "30"}), 30.0)
+        self.assertIsNone(self.limiter.update({}))
+
+    def test_retry_after_date(self):
+        retry_after = self.limiter.update({"Retry-After": formatdate(time.time() + 120, usegmt=True)})
+        self.assertAlmostEqual(retry_after, 120, delta=2)
+
+        # already passed
+        self.assertEqual(self.limiter.update({"Retry-After": formatdate(time.time() - 120, usegmt=True)}), 0)
+
+    def test_retry_after_unparsable(self):
+        self.assertIsNone(self.limiter.update({"Retry-After": "soon"}))
+
+    def test_backoff_blocks_everything(self):
+        self.limiter.backoff(30)
+        self.assertGreater(self.limiter._delay(PRIORITY_HIGH), 29)
+        self.assertGreater(self.limiter._delay(PRIORITY_LOW, core=False), 29)
+        self.assertEqual(self.limiter.retried, 1)
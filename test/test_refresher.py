@@ -0,0 +1,87 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+import discord
+
+from git_vote_cog.refresher import PollRefresher
+
+INTERVAL = 0.2
+
+
+class FakeMessage:
+    def __init__(self):
+        self.edits = []
+
+    async def edit(self, embed: discord.Embed):
+        self.edits.append(embed.title)
+
+
+def poll_vote(msg_id: int, channel_id: int = 10, budget: int = 4) -> SimpleNamespace:
+    discord_conf = SimpleNamespace(refresh_seconds=INTERVAL, refresh_channel_edits=budget)
+    poll = SimpleNamespace(id=SimpleNamespace(channel_id=channel_id, msg_id=msg_id), msg=FakeMessage(), aye_count=0)
+    return SimpleNamespace(poll=poll, config=SimpleNamespace(discord=discord_conf))
+
+
+async def render(vote) -> discord.Embed:
+    return discord.Embed(title=f"{vote.poll.aye_count}")
+
+
+class PollRefresherTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.refresher = PollRefresher(render)
+
+    async def asyncTearDown(self):
+        await self.refresher.stop()
+
+    async def test_changes_coalesced(self):
+        vote = poll_vote(1)
+        for count in range(1, 6):
+            vote.poll.aye_count = count
+            self.refresher.mark(vote)
+        await asyncio.sleep(0.05)
+        self.assertEqual(vote.poll.msg.edits, ["5"])
+
+        # marked again within the interval, edited once it has passed
+        for count in range(6, 9):
+            vote.poll.aye_count = count
+            self.refresher.mark(vote)
+            await asyncio.sleep(0.01)
+        self.assertEqual(vote.poll.msg.edits, ["5"])
+        await asyncio.sleep(INTERVAL)
+        self.assertEqual(vote.poll.msg.edits, ["5", "8"])
+
+    async def test_unchanged_embed_skipped(self):
+        vote = poll_vote(1)
+        self.refresher.mark(vote)
+        await asyncio.sleep(0.05)
+        self.refresher.mark(vote)
+        await asyncio.sleep(INTERVAL)
+
+        self.assertEqual(vote.poll.msg.edits, ["0"])
+        self.assertEqual((self.refresher.edits, self.refresher.skipped), (1, 1))
+
+    async def test_channel_budget_shared(self):
+        votes = [poll_vote(msg_id, budget=2) for msg_id in range(1, 5)]
+        other = poll_vote(5, channel_id=11, budget=2)
+        for vote in [*votes, other]:
+            self.refresher.mark(vote)
+
+        # two edits in the channel right away, the rest once the budget frees up; other channels aren't held up
+        await asyncio.sleep(0.05)
+        self.assertEqual(sum(len(vote.poll.msg.edits) for vote in votes), 2)
+        self.assertEqual(other.poll.msg.edits, ["0"])
+
+        await asyncio.sleep(INTERVAL)
+        self.assertEqual([len(vote.poll.msg.edits) for vote in votes], [1, 1, 1, 1])
+
+    async def test_forget_drops_pending(self):
+        vote = poll_vote(1)
+        self.refresher.mark(vote)
+        await asyncio.sleep(0.05)
+
+        vote.poll.aye_count = 1
+        self.refresher.mark(vote)
+        self.refresher.forget(10, 1)
+        await asyncio.sleep(INTERVAL)
+        self.assertEqual(vote.poll.msg.edits, ["0"])
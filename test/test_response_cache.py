@@ -0,0 +1,82 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from git_vote_cog import github_api
+from git_vote_cog.github_api import GithubClient, ResponseCache
+from test.test_github import rest_pull
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def test_bounded_lru(self):
+        cache = ResponseCache(2)
+        cache.put("a", "1", None, {})
+        cache.put("b", "2", None, {})
+        cache.get("a")
+        cache.put("c", "3", None, {})
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+
+    def test_save_load(self):
+        cache = ResponseCache(10)
+        cache.put("a", '"etag"', "Mon, 01 Jan 2024 00:00:00 GMT", {"number": 1})
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "cache.json"
+            cache.save(path)
+            loaded = ResponseCache(10)
+            loaded.load(path)
+
+        self.assertEqual(loaded.get("a"), ('"etag"', "Mon, 01 Jan 2024 00:00:00 GMT", {"number": 1}))
+
+
+class ConditionalRequestTest(unittest.IsolatedAsyncioTestCase):
+    """Client against a local server answering If-None-Match with 304"""
+
+    async def asyncSetUp(self):
+        self.requests = []
+        self.etag = '"v1"'
+
+        async def get_pull(request: web.Request):
+            self.requests.append(request.headers.get("If-None-Match"))
+            if request.headers.get("If-None-Match") == self.etag:
+                return web.Response(status=304, headers={"ETag": self.etag})
+            return web.json_response(rest_pull(int(request.match_info["pr_id"])), headers={"ETag": self.etag})
+
+        app = web.Application()
+        app.add_routes([web.get("/repos/org/repo/pulls/{pr_id}", get_pull)])
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+        url = str(self.server.make_url("")).rstrip("/")
+        self.patch = mock.patch.object(github_api, "API_URL", url)
+        self.patch.start()
+        self.client = GithubClient("token")
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        self.patch.stop()
+        await self.server.close()
+
+    async def test_not_modified_served_from_cache(self):
+        first = await self.client.get_pull("org/repo", 7)
+        second = await self.client.get_pull("org/repo", 7)
+
+        self.assertEqual(self.requests, [None, '"v1"'])
+        self.assertEqual(second, first)
+        self.assertEqual((self.client.cache.misses, self.client.cache.hits), (1, 1))
+
+    async def test_changed_response_replaces_cache(self):
+        await self.client.get_pull("org/repo", 7)
+        self.etag = '"v2"'
+        await self.client.get_pull("org/repo", 7)
+        await self.client.get_pull("org/repo", 7)
+
+        self.assertEqual(self.requests, [None, '"v1"', '"v2"'])
+        self.assertEqual((self.client.cache.misses, self.client.cache.hits), (2, 1))
@@ -0,0 +1,112 @@
+import asyncio
+import time
+import unittest
+
+from git_vote_cog.scheduler import DeadlineScheduler
+
+
+class DeadlineSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.scheduler = DeadlineScheduler()
+        self.scheduler.start()
+        self.ran = []
+
+    async def asyncTearDown(self):
+        await self.scheduler.stop()
+
+    def callback(self, key):
+        async def run():
+            self.ran.append(key)
+        return run
+
+    async def test_runs_in_deadline_order(self):
+        now = time.time()
+        self.scheduler.schedule("b", now + 0.04, self.callback("b"))
+        self.scheduler.schedule("a", now + 0.02, self.callback("a"))
+        self.scheduler.schedule("c", now + 0.06, self.callback("c"))
+        self.assertEqual(len(self.scheduler), 3)
+        self.assertEqual(self.scheduler.next_deadline, now + 0.02)
+
+        await asyncio.sleep(0.15)
+        self.assertEqual(self.ran, ["a", "b", "c"])
+        self.assertEqual(len(self.scheduler), 0)
+
+    async def test_cancel(self):
+        self.scheduler.schedule("a", time.time() + 0.02, self.callback("a"))
+        self.assertIn("a", self.scheduler)
+        self.assertTrue(self.scheduler.cancel("a"))
+        self.assertFalse(self.scheduler.cancel("a"))
+
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.ran, [])
+        self.assertIsNone(self.scheduler.next_deadline)
+
+    async def test_reschedule(self):
+        now = time.time()
+        self.scheduler.schedule("a", now + 0.02, self.callback("a"))
+        self.scheduler.schedule("b", now + 0.04, self.callback("b"))
+        self.assertTrue(self.scheduler.reschedule("a", now + 0.06))
+        self.assertFalse(self.scheduler.reschedule("missing", now))
+
+        await asyncio.sleep(0.15)
+        self.assertEqual(self.ran, ["b", "a"])
+
+    async def test_schedule_replaces_key(self):
+        self.scheduler.schedule("a", time.time() + 0.02, self.callback("first"))
+        self.scheduler.schedule("a", time.time() + 0.02, self.callback("second"))
+
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.ran, ["second"])
+
+    async def test_earlier_deadline_wakes_driver(self):
+        self.scheduler.schedule("late", time.time() + 10, self.callback("late"))
+        await asyncio.sleep(0.01)
+        self.scheduler.schedule("early", time.time() + 0.02, self.callback("early"))
+
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.ran, ["early"])
+
+    async def test_failing_callback_doesnt_stop_driver(self):
+        async def fail():
+            raise RuntimeError("boom")
+
+        now = time.time()
+        self.scheduler.schedule("fail", now + 0.01, fail)
+        self.scheduler.schedule("a", now + 0.02, self.callback("a"))
+
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.ran, ["a"])
+
+    async def test_stop_drops_pending(self):
+        self.scheduler.schedule("a", time.time() + 0.02, self.callback("a"))
+        await self.scheduler.stop()
+        self.assertEqual(len(self.scheduler), 0)
+
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.ran, [])
+
+    async def test_stop_waits_for_running(self):
+        async def slow():
+            await asyncio.sleep(0.05)
+            self.ran.append("slow")
+
+        self.scheduler.schedule("slow", time.time(), slow)
+        await asyncio.sleep(0.01)
+        await self.scheduler.stop()
+        self.assertEqual(self.ran, ["slow"])
+
+    async def test_stop_cancels_after_timeout(self):
+        cancelled = asyncio.Event()
+
+        async def hang():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        self.scheduler.schedule("hang", time.time(), hang)
+        await asyncio.sleep(0.01)
+        await self.scheduler.stop(timeout=0.02)
+        self.assertTrue(cancelled.is_set())
+        self.assertEqual(len(self.scheduler.running), 0)
@@ -0,0 +1,98 @@
+import unittest
+from types import SimpleNamespace
+
+from git_vote_cog.tally import count_voters
+
+AYE = "👍"
+NAY = "👎"
+BOT = 0
+
+
+class FakeReaction:
+    def __init__(self, emoji: str, users):
+        self.emoji = emoji
+        self.user_ids = list(users)
+        self.count = len(self.user_ids)
+        self.me = BOT in self.user_ids
+        self.listed = 0
+
+    async def users(self):
+        for user_id in self.user_ids:
+            self.listed += 1
+            yield SimpleNamespace(id=user_id, bot=user_id == BOT)
+
+
+def poll(ayes, nays):
+    # the bot seeds both reactions, like a real poll
+    return SimpleNamespace(reactions=[FakeReaction(AYE, [BOT, *ayes]), FakeReaction(NAY, [BOT, *nays])])
+
+
+class CountVotersTest(unittest.IsolatedAsyncioTestCase):
+    async def test_bots_excluded(self):
+        tally = await count_voters(poll([1, 2], [3, 4]), AYE, NAY)
+        self.assertEqual((tally.aye_count, tally.nay_count), (2, 2))
+        self.assertTrue(tally.complete)
+        self.assertFalse(tally.is_vote_accepted())
+
+    async def test_no_reactions(self):
+        tally = await count_voters(SimpleNamespace(reactions=[]), AYE, NAY)
+        self.assertEqual((tally.aye_count, tally.nay_count), (0, 0))
+        self.assertTrue(tally.complete)
+
+    async def test_duplicate_rules(self):
+        expected = {
+            "drop": (1, 1),
+            "aye": (2, 1),
+            "nay": (1, 2),
+            "count_both": (2, 2),
+        }
+        for rule, counts in expected.items():
+            tally = await count_voters(poll([1, 2], [3, 2]), AYE, NAY, rule)
+            self.assertEqual((tally.aye_count, tally.nay_count), counts, rule)
+            self.assertTrue(tally.complete, rule)
+
+    async def test_unknown_rule(self):
+        with self.assertRaises(ValueError):
+            await count_voters(poll([], []), AYE, NAY, "bogus")
+
+    async def test_bot_reaction_doesnt_settle(self):
+        # the bot's own nay isn't a vote, counting goes on to the human nay
+        tally = await count_voters(poll([], [1]), AYE, NAY)
+        self.assertEqual((tally.aye_count, tally.nay_count), (0, 1))
+        self.assertTrue(tally.complete)
+
+    async def test_duplicate_doesnt_settle(self):
+        # dropping the duplicate voter leaves 0-0, that alone isn't a rejection
+        tally = await count_voters(poll([1], [1, 2, 3, 4, 5, 6]), AYE, NAY)
+        self.assertEqual((tally.aye_count, tally.nay_count), (0, 1))
+        self.assertFalse(tally.complete)
+        self.assertFalse(tally.is_vote_accepted())
+
+    async def test_stops_once_rejected(self):
+        msg = poll([1], [2, 3, 4, 5, 6])
+        tally = await count_voters(msg, AYE, NAY)
+        self.assertEqual((tally.aye_count, tally.nay_count), (1, 1))
+        self.assertFalse(tally.complete)
+        self.assertFalse(tally.is_vote_accepted())
+        self.assertEqual(msg.reactions[1].listed, 2)
+
+    async def test_stops_once_accepted(self):
+        # the duplicate keeps its aye, the two nays left can't overturn 3-0
+        msg = poll([1, 2, 3], [1, 2, 4])
+        tally = await count_voters(msg, AYE, NAY, "aye")
+        self.assertEqual((tally.aye_count, tally.nay_count), (3, 0))
+        self.assertFalse(tally.complete)
+        self.assertTrue(tally.is_vote_accepted())
+        self.assertEqual(msg.reactions[1].listed, 2)
+
+    async def test_nay_stream_skipped(self):
+        msg = poll([1, 2, 3, 4], [5])
+        tally = await count_voters(msg, AYE, NAY)
+        self.assertEqual(msg.reactions[1].listed, 0)
+        self.assertFalse(tally.complete)
+        self.assertTrue(tally.is_vote_accepted())
+
+        # only the bot's nay, nothing left to count
+        tally = await count_voters(poll([1], []), AYE, NAY)
+        self.assertEqual((tally.aye_count, tally.nay_count), (1, 0))
+        self.assertTrue(tally.complete)
@@ -0,0 +1,238 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from git_vote_cog.config import WebhookConfig
+from git_vote_cog.db import VoteDB
+from git_vote_cog.webhook import Webhook, LabelEvent, DeliveryCache
+
+SECRET = "secret"
+
+
+def label_payload(pr_id: int, label: str = "needs_vote", action: str = "labeled") -> bytes:
+    return json.dumps({
+        "action": action,
+        "pull_request": {"number": pr_id},
+        "label": {"name": label},
+        "repository": {"full_name": "org/repo"},
+    }).encode()
+
+
+def headers(body: bytes, delivery_id: str = None, event: str = "pull_request", sha_name: str = "sha256") -> dict:
+    signature = hmac.new(SECRET.encode(), msg=body, digestmod=sha_name).hexdigest()
+    header = "X-Hub-Signature-256" if sha_name == "sha256" else "X-Hub-Signature"
+    result = {"X-GitHub-Event": event, header: f"{sha_name}={signature}"}
+    if delivery_id is not None:
+        result["X-GitHub-Delivery"] = delivery_id
+    return result
+
+
+class WebhookTestCase(unittest.IsolatedAsyncioTestCase):
+    """Webhook with its app behind a test client, events end up in `self.events`"""
+
+    def config(self) -> WebhookConfig:
+        config = WebhookConfig()
+        config.secret = SECRET
+        config.host = "127.0.0.1"
+        config.port = 0
+        return config
+
+    async def asyncSetUp(self):
+        self.events = []
+        self.release = asyncio.Event()
+        self.release.set()
+        self.webhook = Webhook(self.config(), self.callback)
+        await self.webhook.start()
+        self.client = TestClient(TestServer(self.webhook.http.app))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        self.release.set()
+        await self.client.close()
+        await self.webhook.stop(timeout=1)
+
+    async def callback(self, event: LabelEvent):
+        await self.release.wait()
+        self.events.append(event.pr_id)
+
+    async def post(self, body: bytes, **kwargs):
+        return await self.client.post(self.webhook.config.path, data=body, headers=headers(body, **kwargs))
+
+
+class QueueTest(WebhookTestCase):
+    def config(self) -> WebhookConfig:
+        config = super().config()
+        config.queue_size = 2
+        config.workers = 1
+        return config
+
+    async def test_acknowledged_before_handling(self):
+        self.release.clear()
+        resp = await self.post(label_payload(1))
+        self.assertEqual(resp.status, 202)
+        self.assertEqual(self.events, [])
+
+        self.release.set()
+        await self.webhook.queue.join()
+        self.assertEqual(self.events, [1])
+
+    async def test_overflow_drops_oldest(self):
+        self.release.clear()
+        for pr_id in range(1, 5):
+            self.assertEqual((await self.post(label_payload(pr_id))).status, 202)
+            await asyncio.sleep(0.01)
+
+        # the worker holds 1, the queue keeps the newest two
+        self.release.set()
+        await self.webhook.queue.join()
+        self.assertEqual(self.events, [1, 3, 4])
+        self.assertEqual(self.webhook.dropped, 1)
+
+    async def test_stop_drains_queue(self):
+        self.release.clear()
+        for pr_id in range(1, 4):
+            await self.post(label_payload(pr_id))
+
+        asyncio.get_running_loop().call_later(0.05, self.release.set)
+        await self.webhook.stop(timeout=1)
+        self.assertEqual(self.events, [1, 2, 3])
+
+
+class DropNewestTest(WebhookTestCase):
+    def config(self) -> WebhookConfig:
+        config = super().config()
+        config.queue_size = 1
+        config.workers = 1
+        config.overflow = "drop_newest"
+        return config
+
+    async def test_overflow_rejects_newest(self):
+        self.release.clear()
+        self.assertEqual((await self.post(label_payload(1))).status, 202)
+        await asyncio.sleep(0.01)
+        self.assertEqual((await self.post(label_payload(2))).status, 202)
+        self.assertEqual((await self.post(label_payload(3))).status, 503)
+
+        self.release.set()
+        await self.webhook.queue.join()
+        self.assertEqual(self.events, [1, 2])
+
+    async def test_overflow_delivery_not_recorded(self):
+        self.release.clear()
+        await self.post(label_payload(1))
+        await asyncio.sleep(0.01)
+        await self.post(label_payload(2))
+        self.assertEqual((await self.post(label_payload(3), delivery_id="c")).status, 503)
+
+        self.release.set()
+        await self.webhook.queue.join()
+        self.assertEqual((await self.post(label_payload(3), delivery_id="c")).status, 202)
+        await self.webhook.queue.join()
+        self.assertEqual(self.events, [1, 2, 3])
+
+
+class DedupTest(WebhookTestCase):
+    async def test_redelivery_ignored(self):
+        body = label_payload(1)
+        self.assertEqual((await self.post(body, delivery_id="a")).status, 202)
+        self.assertEqual((await self.post(body, delivery_id="a")).status, 200)
+        self.assertEqual((await self.post(body, delivery_id="b")).status, 202)
+
+        await self.webhook.queue.join()
+        self.assertEqual(self.events, [1, 1])
+
+    async def test_rejected_delivery_not_recorded(self):
+        # an undecodable payload isn't taken for a duplicate when github redelivers it
+        body = b"{not json"
+        self.assertEqual((await self.post(body, delivery_id="a")).status, 400)
+        self.assertEqual((await self.post(label_payload(1), delivery_id="a")).status, 202)
+
+        await self.webhook.queue.join()
+        self.assertEqual(self.events, [1])
+
+
+class DeliveryCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def test_bounded(self):
+        cache = DeliveryCache(2, 3600)
+        for delivery_id in ("a", "b", "c"):
+            await cache.add(delivery_id)
+
+        self.assertFalse(await cache.seen("a"))
+        self.assertTrue(await cache.seen("b"))
+        self.assertTrue(await cache.seen("c"))
+
+    async def test_expired(self):
+        cache = DeliveryCache(10, 0)
+        await cache.add("a")
+        cache.entries["a"] -= 1
+        self.assertFalse(await cache.seen("a"))
+
+    async def test_persisted(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = VoteDB(Path(tmp))
+            await db.init()
+            try:
+                await DeliveryCache(10, 3600, db).add("a")
+
+                # a fresh cache, as after a restart
+                cache = DeliveryCache(10, 3600, db)
+                self.assertTrue(await cache.seen("a"))
+                self.assertFalse(await cache.seen("b"))
+            finally:
+                await db.close()
+
+
+class VerifyTest(WebhookTestCase):
+    def config(self) -> WebhookConfig:
+        config = super().config()
+        config.max_body_bytes = 4096
+        config.offload_bytes = 256
+        return config
+
+    async def test_other_events_skipped(self):
+        body = label_payload(1)
+        self.assertEqual((await self.post(body, event="ping")).status, 200)
+        self.assertEqual((await self.post(body, event="push")).status, 204)
+
+    async def test_signature(self):
+        body = label_payload(1)
+        self.assertEqual((await self.post(body, sha_name="sha1")).status, 202)
+
+        resp = await self.client.post(self.webhook.config.path, data=body, headers={"X-GitHub-Event": "pull_request"})
+        self.assertEqual(resp.status, 403)
+
+        bad = headers(body)
+        bad["X-Hub-Signature-256"] = "sha256=" + "0" * 64
+        resp = await self.client.post(self.webhook.config.path, data=body, headers=bad)
+        self.assertEqual(resp.status, 403)
+
+        bad["X-Hub-Signature-256"] = "md5=" + "0" * 32
+        resp = await self.client.post(self.webhook.config.path, data=body, headers=bad)
+        self.assertEqual(resp.status, 403)
+
+        await self.webhook.queue.join()
+        self.assertEqual(self.events, [1])
+
+    async def test_body_size_capped(self):
+        body = json.dumps({"action": "opened", "padding": "x" * 8192}).encode()
+        self.assertEqual((await self.post(body)).status, 413)
+
+    async def test_large_payload_decoded(self):
+        # above offload_bytes, decoded off the event loop
+        payload = json.loads(label_payload(1))
+        payload["pull_request"]["body"] = "x" * 1024
+        self.assertEqual((await self.post(json.dumps(payload).encode())).status, 202)
+
+        await self.webhook.queue.join()
+        self.assertEqual(self.events, [1])
+
+    async def test_other_actions_acknowledged(self):
+        self.assertEqual((await self.post(label_payload(1, action="opened"))).status, 202)
+        await self.webhook.queue.join()
+        self.assertEqual(self.events, [])